@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+""" Batched changes and documents of a contract.
+
+Operations of a batch are checked with the validators of the single change
+and document POSTs against one loaded contract, which gets all of them or
+none: the first failing operation fails the request. The contract is saved
+once, with one revision for the whole batch. Errors of an operation are
+named by its index in request data, e.g. `data.3.relatedItem`.
+"""
+from logging import getLogger
+
+from pyramid.httpexceptions import HTTPError
+
+from openprocurement.api.utils import (
+    check_document,
+    context_unpack,
+    error_handler,
+    update_document_url,
+)
+from openprocurement.api.validation import validate_data
+from openprocurement.contracting.api.utils import save_contract
+from openprocurement.contracting.core.validation import (
+    validate_add_document_to_active_change,
+    validate_contract_change_add_not_in_allowed_contract_status,
+    validate_contract_document_operation_not_in_allowed_contract_status,
+    validate_create_contract_change,
+)
+
+LOGGER = getLogger(__name__)
+DOCUMENT_ROUTE = 'Contract Documents'
+
+
+def add_change(request, data):
+    contract = request.validated['contract']
+    validate_data(request, type(contract).changes.model_class, data=data)
+    validate_contract_change_add_not_in_allowed_contract_status(request)
+    validate_create_contract_change(request)
+    change = request.validated['change']
+    contract.changes.append(change)
+    return change
+
+
+def add_document(request, data, change=None):
+    """ Add document uploaded to document service to request contract.
+
+    Change documents without `relatedItem` belong to the change added by
+    the same batch.
+    """
+    contract = request.validated['contract']
+    if change is not None and data.get('documentOf') == 'change' and not data.get('relatedItem'):
+        data = dict(data, relatedItem=change.id)
+    validate_data(request, type(contract).documents.model_class, data=data)
+    validate_contract_document_operation_not_in_allowed_contract_status(request)
+    validate_add_document_to_active_change(request)
+    document = request.validated['document']
+    check_document(request, document, 'body')
+    document = update_document_url(request, document, DOCUMENT_ROUTE, {})
+    contract.documents.append(document)
+    return document
+
+
+def operation_error_name(index, name):
+    return 'data.{}'.format(index) if name == 'data' else 'data.{}.{}'.format(index, name)
+
+
+def apply_batch(request, operations):
+    """ Apply change and document `operations` to request contract and save
+    it, return added changes and documents in order of operations.
+    """
+    added = []
+    change = None
+    for index, operation in enumerate(operations):
+        try:
+            if operation['type'] == 'change':
+                change = add_change(request, operation['data'])
+                added.append(('change', change))
+            else:
+                added.append(('document', add_document(request, operation['data'], change)))
+        except HTTPError:
+            if not request.errors:
+                raise
+            for error in request.errors:
+                error['name'] = operation_error_name(index, error['name'])
+            raise error_handler(request.errors)
+    if not save_contract(request):
+        return None
+    for kind, item in added:
+        LOGGER.info('Created contract {} {}'.format(kind, item.id),
+                    extra=context_unpack(request, {'MESSAGE_ID': 'contract_{}_create'.format(kind)},
+                                         {'{}_id'.format(kind): item.id}))
+    return [item for kind, item in added]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" Bulk creation of contracts.
+
+Each contract of a bulk request is validated with the model registered for
+its contractType, and all valid contracts are prepared by `Contract.to_store`
+as for a single save before any of them is written. Prepared contracts are
+stored with one `_bulk_docs` request per batch. Every
+contract gets its own result: created contract with its credentials, or
+status and errors of its validation or saving.
+"""
+from logging import getLogger
+
+from couchdb.http import ResourceConflict
+from schematics.exceptions import ModelConversionError, ModelValidationError
+
+from openprocurement.api.utils import (
+    add_revision,
+    context_unpack,
+    get_now,
+    get_revision_changes,
+    set_modetest_titles,
+)
+from openprocurement.contracting.core.utils import set_ownership
+
+LOGGER = getLogger(__name__)
+BULK_BATCH_SIZE = 100
+BULK_MAX_SIZE = 1000
+
+
+def bulk_error(name, description, location='body'):
+    return {'location': location, 'name': name, 'description': description}
+
+
+def model_errors(error):
+    """ Bulk errors of model conversion or validation `error` """
+    return [bulk_error(key, messages) for key, messages in error.messages.items()]
+
+
+def build_contract(request, data):
+    """ Build contract to create from bulk item `data`.
+
+    Returns (contract, None) or (None, (status, errors)) when the item can't
+    be created, statuses and errors are the same as of a single POST.
+    """
+    if not isinstance(data, dict):
+        return None, (422, [bulk_error('data', 'Data not available')])
+    model = request.registry.contract_contractTypes.get(data.get('contractType', 'common'))
+    if model is None:
+        return None, (415, [bulk_error('contractType', 'Not implemented', 'data')])
+    if hasattr(request, 'check_accreditation') and not request.check_accreditation(model.create_accreditation):
+        return None, (403, [bulk_error('accreditation', 'Broker Accreditation level does not permit contract creation',
+                                       'contract')])
+    try:
+        m = model(data)
+        m.__parent__ = request.context
+        m.validate()
+        contract = model(m.serialize('create'))
+        contract.__parent__ = request.context
+        for i in data.get('documents', []):
+            doc = type(contract).documents.model_class(i)
+            doc.__parent__ = contract
+            contract.documents.append(doc)
+        contract.validate()
+    except (ModelValidationError, ModelConversionError) as e:
+        return None, (422, model_errors(e))
+    except ValueError as e:
+        return None, (422, [bulk_error('data', e.message)])
+    set_ownership(contract, request)
+    if contract.mode == u'test':
+        set_modetest_titles(contract)
+    add_revision(request, contract, get_revision_changes(contract.serialize('plain'), {}))
+    contract.dateModified = get_now()
+    return contract, None
+
+
+def create_contracts(request, items, batch_size=None):
+    """ Create contracts from `items` data, return list of their results """
+    batch_size = batch_size or BULK_BATCH_SIZE
+    db = request.registry.db
+    results = [None] * len(items)
+    pending = []
+    ids = set()
+    for index, data in enumerate(items):
+        contract, error = build_contract(request, data)
+        if contract is not None and contract._id in ids:
+            contract, error = None, (409, [bulk_error('id', 'Duplicate contract id')])
+        if error:
+            results[index] = {'status': error[0], 'errors': error[1]}
+            continue
+        try:
+            doc = contract.to_store(db)
+        except (ModelValidationError, ModelConversionError) as e:
+            results[index] = {'status': 422, 'errors': model_errors(e)}
+            continue
+        if contract._id:
+            ids.add(contract._id)
+        pending.append((index, contract, doc))
+
+    for start in xrange(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        saved = db.update([doc for index, contract, doc in batch])
+        for (index, contract, doc), (success, docid, rev_or_exc) in zip(batch, saved):
+            if not success:
+                if isinstance(rev_or_exc, ResourceConflict):
+                    results[index] = {'status': 409, 'errors': [bulk_error('id', 'Contract already exists')]}
+                else:
+                    results[index] = {'status': 422, 'errors': [bulk_error('data', str(rev_or_exc))]}
+                continue
+            contract._id, contract._rev = docid, rev_or_exc
+            LOGGER.info('Created contract {} ({})'.format(contract.id, contract.contractID),
+                        extra=context_unpack(request, {'MESSAGE_ID': 'contract_create'},
+                                             {'contract_id': contract.id, 'contractID': contract.contractID or ''}))
+            results[index] = {
+                'status': 201,
+                'data': contract.serialize('view'),
+                'access': {'token': contract.owner_token},
+            }
+    return results
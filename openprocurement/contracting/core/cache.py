@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+""" Caches of contracts read from the database. """
+import json
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock, Thread
+from time import sleep, time
+
+from couchdb import json as couchdb_json
+from couchdb.client import Document
+
+LOGGER = logging.getLogger(__name__)
+SERIALIZE_CACHE_ROLES = ('view',)
+READ_CACHE_SIZE = 2 ** 12
+READ_CACHE_TTL = 60
+RECENT_INVALIDATIONS = 2 ** 10
+CHANGES_HEARTBEAT = 10000
+CHANGES_RETRY = 5
+
+
+class SerializeCache(object):
+    """ LRU cache of serialized contracts limited by memory `budget`.
+
+    Entries are keyed by contract id, `_rev` and role, so a saved contract
+    is never served from cache: saving gives it a new `_rev`. Contracts
+    changed but not saved keep their `_rev`, so only read-only requests
+    use the cache (see `Contract.serialize`). Entries are
+    kept as JSON, so every hit decodes a copy callers are free to change,
+    and their size is the length of the JSON.
+    """
+
+    def __init__(self, budget, roles=SERIALIZE_CACHE_ROLES):
+        self.budget = budget
+        self.roles = roles
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+        return json.loads(entry[0])
+
+    def put(self, key, data):
+        text = json.dumps(data)
+        size = len(text)
+        if size > self.budget:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (text, size)
+            self.size += size
+            while self.size > self.budget:
+                evicted = self._entries.popitem(last=False)[1]
+                self.size -= evicted[1]
+
+    def status(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class ContractCache(object):
+    """ Process-local LRU cache of raw contract documents.
+
+    Documents are kept JSON encoded, so each read gets its own copy.
+    Entries are dropped on changes of the documents reported by
+    `ChangesListener` and are not used after `ttl` seconds, which bounds
+    staleness if the listener falls behind. A document read while it is
+    being changed is not cached.
+    """
+
+    def __init__(self, size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.listener = None
+        self._entries = OrderedDict()
+        self._recent = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, db, doc_id, default=None):
+        self.listen(db)
+        with self._lock:
+            entry = self._entries.pop(doc_id, None)
+            if entry is not None and entry[1] > time():
+                self._entries[doc_id] = entry
+                self.hits += 1
+                return Document(couchdb_json.decode(entry[0]))
+            self.misses += 1
+            generation = self.generation
+        doc = db.get(doc_id, default)
+        if doc is not default and doc.get('doc_type') == 'Contract':
+            self.put(doc_id, doc, generation)
+        return doc
+
+    def put(self, doc_id, doc, generation):
+        """ Cache `doc` read when cache was at `generation` """
+        data = couchdb_json.encode(doc)
+        with self._lock:
+            if not self._unchanged_since(doc_id, generation):
+                return
+            self._entries.pop(doc_id, None)
+            self._entries[doc_id] = (data, time() + self.ttl)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _unchanged_since(self, doc_id, generation):
+        if doc_id in self._recent:
+            return self._recent[doc_id] <= generation
+        if len(self._recent) >= RECENT_INVALIDATIONS:
+            # changes of doc_id may have been forgotten already
+            return next(iter(self._recent.values())) <= generation
+        return True
+
+    def invalidate(self, doc_id):
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(doc_id, None)
+            self._recent.pop(doc_id, None)
+            self._recent[doc_id] = self.generation
+            while len(self._recent) > RECENT_INVALIDATIONS:
+                self._recent.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._recent.clear()
+
+    def listen(self, db):
+        """ Start changes listener in this process if it is not running """
+        listener = self.listener
+        if listener is None or listener.pid != os.getpid() or not listener.is_alive():
+            with self._lock:
+                if self.listener is listener:
+                    self.listener = ChangesListener(db, self)
+                    self.listener.start()
+
+
+class ChangesListener(Thread):
+    """ Drop cached documents changed in the database.
+
+    Follows continuous `_changes` feed from the moment it is started, the
+    whole cache is dropped when the feed breaks, as changes may be missed
+    until it is followed again.
+    """
+
+    def __init__(self, db, cache):
+        super(ChangesListener, self).__init__(name='ContractCacheListener')
+        self.daemon = True
+        self.db = db
+        self.cache = cache
+        self.pid = os.getpid()
+        self.since = 'now'
+
+    def run(self):
+        while True:
+            try:
+                self.follow()
+            except Exception:
+                LOGGER.exception('Contracts changes feed failed')
+            self.cache.clear()
+            sleep(CHANGES_RETRY)
+
+    def follow(self):
+        for change in self.db.changes(feed='continuous', since=self.since, heartbeat=CHANGES_HEARTBEAT):
+            if 'id' in change:
+                self.cache.invalidate(change['id'])
+            if 'seq' in change or 'last_seq' in change:
+                self.since = change.get('seq', change.get('last_seq'))
+
+
+class CachedDatabase(object):
+    """ Database reading contracts through `ContractCache`.
+
+    Other calls go to the database, documents saved through it are dropped
+    from the cache right away.
+    """
+
+    def __init__(self, db, cache):
+        self.db = db
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def __contains__(self, id):
+        return id in self.db
+
+    def __len__(self):
+        return len(self.db)
+
+    def __iter__(self):
+        return iter(self.db)
+
+    def __nonzero__(self):
+        return True
+
+    def __getitem__(self, id):
+        return self.db[id]
+
+    def __setitem__(self, id, content):
+        self.db[id] = content
+        self.cache.invalidate(id)
+
+    def __delitem__(self, id):
+        del self.db[id]
+        self.cache.invalidate(id)
+
+    def get(self, id, default=None, **options):
+        if options:
+            return self.db.get(id, default, **options)
+        return self.cache.get(self.db, id, default)
+
+    def save(self, doc, **options):
+        try:
+            return self.db.save(doc, **options)
+        finally:
+            if doc.get('_id'):
+                self.cache.invalidate(doc['_id'])
+
+    def update(self, documents, **options):
+        try:
+            return self.db.update(documents, **options)
+        finally:
+            for doc in documents:
+                if doc.get('_id'):
+                    self.cache.invalidate(doc['_id'])
+
+
+def enable_read_cache(event):
+    """ `ApplicationCreated` subscriber reading contracts through cache """
+    registry = event.app.registry
+    settings = registry.settings
+    cache = ContractCache(int(settings['contracts.read_cache']),
+                          float(settings.get('contracts.read_cache_ttl', READ_CACHE_TTL)))
+    registry.db = CachedDatabase(registry.db, cache)
@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 from logging import getLogger
 from pkg_resources import get_distribution, iter_entry_points
+from pyramid.events import ApplicationCreated
 from pyramid.interfaces import IRequest
+from pyramid.settings import asbool
+from pyramid.tweens import EXCVIEW
 
 from openprocurement.contracting.core.utils import (
+    contract_from_data,
     isContract,
     register_contract_contractType
 )
 from openprocurement.api.interfaces import IContentConfigurator
-from openprocurement.contracting.core.models import IContract
+from openprocurement.contracting.core.models import IContract, LAZY_FIELDS
 from openprocurement.contracting.core.adapters import ContractConfigurator
+from openprocurement.contracting.core.cache import SerializeCache, enable_read_cache
+from openprocurement.contracting.core.revisions import (
+    check_revisions_readers,
+    contract_revisions,
+    register_contract_revisions_reader
+)
 
 
 PKG = get_distribution(__package__)
@@ -28,8 +38,40 @@ def includeme(config):
     config.registry.registerAdapter(ContractConfigurator, (IContract, IRequest),
                                     IContentConfigurator)
 
-    # search for plugins
     settings = config.get_settings()
+    # keep compound fields of loaded contracts raw until first access
+    config.registry.contract_lazy_fields = LAZY_FIELDS if asbool(settings.get('contracts.lazy_load')) else ()
+    # upgrade contracts on read while migration runs in background
+    if asbool(settings.get('migration.lazy')) or config.registry.contract_lazy_fields:
+        config.add_request_method(contract_from_data)
+    # move old revisions out of contract documents, once revisions views
+    # read them with request.contract_revisions
+    config.registry.contract_revisions_tail = None
+    config.registry.contract_revisions_readers = []
+    config.add_directive('add_contract_revisions_reader',
+                         register_contract_revisions_reader)
+    if settings.get('contracts.revisions_tail'):
+        config.registry.contract_revisions_tail = int(settings['contracts.revisions_tail'])
+        config.add_subscriber(check_revisions_readers, ApplicationCreated)
+    # full list of revisions, archived ones included, for revisions views
+    config.add_request_method(contract_revisions, reify=True)
+    # ETag and If-None-Match support for contracts and their sub-resources,
+    # right over the exception view tween: it sees error responses of
+    # views, and its 304 responses skip the views
+    if asbool(settings.get('contracts.conditional_get')):
+        config.registry.contract_route_prefix = config.route_prefix
+        config.add_tween('openprocurement.contracting.core.tweens.conditional_get_tween_factory',
+                         over=EXCVIEW)
+    # cache serialized view of stored contracts, budget in bytes
+    config.registry.contract_serialize_cache = None
+    if settings.get('contracts.serialize_cache'):
+        config.registry.contract_serialize_cache = SerializeCache(int(settings['contracts.serialize_cache']))
+
+    # read contracts through process cache, invalidated from _changes feed
+    if settings.get('contracts.read_cache'):
+        config.add_subscriber(enable_read_cache, ApplicationCreated)
+
+    # search for plugins
     plugins = settings.get('plugins') and settings['plugins'].split(',')
     for entry_point in iter_entry_points(
             'openprocurement.contracting.core.plugins'):
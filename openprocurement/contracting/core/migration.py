@@ -1,12 +1,38 @@
 # -*- coding: utf-8 -*-
 import logging
-from openprocurement.api.utils import get_now
+from collections import Counter
+from multiprocessing import Pool
+from Queue import Queue
+from threading import Thread
+from pyramid.exceptions import ConfigurationError
+from pyramid.settings import asbool
+from copy import deepcopy
+from string import hexdigits
+from time import sleep, time
+from urlparse import parse_qs, urlparse
+from couchdb import Database, json
+from couchdb.http import Resource, ResourceConflict, Session
+from repoze.lru import ExpiringLRUCache, LRUCache
+from openprocurement.api.utils import get_now, generate_docservice_url
 from openprocurement.contracting.api.traversal import Root
 from openprocurement.contracting.core.models import Contract
 
 LOGGER = logging.getLogger(__name__)
 SCHEMA_VERSION = 2
 SCHEMA_DOC = 'openprocurement_contracts_schema'
+RANGES_PER_WORKER = 4
+TENDERS_CACHE_SIZE = 2 ** 12
+TENDERS_CACHE_TTL = 60  # seconds, for tenders read on contracts upgrade
+SCHEMA_CHECK_INTERVAL = 10  # seconds
+CHECKPOINT_INTERVAL = 10
+MIN_WRITE_BATCH = 2 ** 4
+MAX_WRITE_BATCH = 2 ** 10
+WRITE_LATENCY = 1.0  # seconds
+WRITE_QUEUE_SIZE = 2 ** 11
+CONFLICT_RETRIES = 3
+MAX_SLOWDOWN = 2 ** 6
+
+_registry = None
 
 
 def get_db_schema_version(db):
@@ -17,77 +43,696 @@ def get_db_schema_version(db):
 def set_db_schema_version(db, version):
     schema_doc = db.get(SCHEMA_DOC, {"_id": SCHEMA_DOC})
     schema_doc["version"] = version
+    schema_doc.pop("migration", None)
     db.save(schema_doc)
 
 
-def migrate_data(registry, destination=None):
+def get_migration_state(db, step):
+    """ Get saved progress (key ranges and checkpoints) of migration `step` """
+    schema_doc = db.get(SCHEMA_DOC, {"_id": SCHEMA_DOC})
+    migration = schema_doc.get("migration", {})
+    return migration if migration.get("step") == step else {"step": step}
+
+
+def update_migration_state(db, step, **kwargs):
+    while True:
+        schema_doc = db.get(SCHEMA_DOC, {"_id": SCHEMA_DOC})
+        migration = schema_doc.get("migration", {})
+        if migration.get("step") != step:
+            migration = {"step": step}
+        for key, value in kwargs.items():
+            if isinstance(value, dict):
+                migration.setdefault(key, {}).update(value)
+            else:
+                migration[key] = value
+        schema_doc["migration"] = migration
+        try:
+            db.save(schema_doc)
+        except ResourceConflict:
+            # other worker saved its checkpoint meanwhile
+            continue
+        return
+
+
+def get_checkpoint(db, step, part=0):
+    return get_migration_state(db, step).get("checkpoints", {}).get(str(part), {})
+
+
+def set_checkpoint(db, step, part, checkpoint):
+    update_migration_state(db, step, checkpoints={str(part): checkpoint})
+
+
+def migrate_data(registry, destination=None, dry_run=False, limit=None):
+    """ Migrate contracts to `destination` (or the latest) schema version.
+
+    With `dry_run` steps are run without saving anything and a list of
+    reports is returned (see `dry_run_step`), `limit` restricts number of
+    contracts scanned in each key range.
+
+    With `migration.lazy` the API doesn't wait for migration and upgrades
+    contracts on read. `migration.background` (which requires lazy mode)
+    runs the remaining steps in a thread of this process, it should be set
+    for a single process only, as each one would sweep the database.
+    """
     if registry.settings.get('plugins') and 'contracting' not in registry.settings['plugins'].split(','):
         return
+    settings = registry.settings
+    lazy = asbool(settings.get('migration.lazy'))
+    background = asbool(settings.get('migration.background'))
+    if background and not lazy:
+        raise ConfigurationError('migration.background requires migration.lazy, '
+                                 'otherwise contracts are served unmigrated')
+    if background and not asbool(settings.get('migration.sweeper', True)):
+        raise ConfigurationError('migration.background with migration.sweeper disabled never migrates contracts')
     cur_version = get_db_schema_version(registry.db)
     if cur_version == SCHEMA_VERSION:
+        return [] if dry_run else cur_version
+    if not dry_run and lazy:
+        registry.contracts_schema_version = cur_version
+        registry.contracts_schema_checked = time()
+        registry.contracts_tenders_cache = ExpiringLRUCache(TENDERS_CACHE_SIZE, TENDERS_CACHE_TTL)
+        scheduler = getattr(registry, 'migration_scheduler', None)
+        if background and (scheduler is None or not scheduler.is_alive()):
+            registry.migration_scheduler = MigrationScheduler(registry, destination, Throttle.from_settings(settings))
+            registry.migration_scheduler.start()
         return cur_version
+    workers = int(registry.settings.get('migration.workers', 1))
+    options = {'limit': limit} if limit else {}
+    reports = []
     for step in xrange(cur_version, destination or SCHEMA_VERSION):
         LOGGER.info("Migrate openprocurement contracts schema from {} to {}".
                     format(step, step + 1), extra={'MESSAGE_ID': 'migrate_data'})
         migration_func = globals().get('from{}to{}'.format(step, step + 1))
+        if dry_run:
+            if migration_func:
+                reports.append(dry_run_step(registry, migration_func, workers, **options))
+            continue
         if migration_func:
-            migration_func(registry)
+            run_migration_step(registry, migration_func, workers)
         set_db_schema_version(registry.db, step + 1)
+    if dry_run:
+        return reports
 
 
-def from0to1(registry):
-    LOGGER.info("Start contracts migration.", extra={'MESSAGE_ID': 'migrate_data'})
-    results = registry.db.iterview('contracts/all', 2 ** 10, include_docs=True)
-    docs = []
-    for i in results:
-        doc = i.doc
-
-        if "suppliers" not in doc:
-            tender_id = doc['tender_id']
-            rel_award = doc['awardID']
-            tender_doc = registry.db.get(tender_id)
-
-            rel_award = [aw for aw in tender_doc['awards'] if aw['id'] == doc['awardID']]
-            if not rel_award:
-                LOGGER.warn("Related award {} for contract {} not found!".
-                            format(doc['awardID'], doc['id']), extra={'MESSAGE_ID': 'migrate_data'})
+def upgrade_contract(registry, doc):
+    """ Upgrade raw contract `doc` to `SCHEMA_VERSION` in memory.
+
+    Documents without `schemaVersion` are considered to have version of
+    the database. Upgrades are done with `upgradeXtoY` functions, those
+    are also used by `fromXtoY` migration steps.
+    """
+    version = doc.get('schemaVersion')
+    if version is None:
+        version = get_contracts_schema_version(registry)
+    if version >= SCHEMA_VERSION:
+        return doc
+    for step in xrange(version, SCHEMA_VERSION):
+        upgrade_func = globals().get('upgrade{}to{}'.format(step, step + 1))
+        if upgrade_func:
+            doc = upgrade_func(registry, doc) or doc
+    doc['schemaVersion'] = SCHEMA_VERSION
+    return doc
+
+
+def get_contracts_schema_version(registry):
+    """ Database schema version known to this process.
+
+    While migration is not finished the version is read again from
+    `SCHEMA_DOC` every `SCHEMA_CHECK_INTERVAL` seconds, as migration steps
+    may be finished by another process.
+    """
+    version = getattr(registry, 'contracts_schema_version', SCHEMA_VERSION)
+    if version < SCHEMA_VERSION and time() > getattr(registry, 'contracts_schema_checked', 0) + SCHEMA_CHECK_INTERVAL:
+        registry.contracts_schema_checked = time()
+        version = registry.contracts_schema_version = get_db_schema_version(registry.db)
+    return version
+
+
+class Throttle(object):
+    """ Rate limiter of migration running along with live traffic.
+
+    Caps contracts read per second and bulk writes per second (0 means
+    no limit). When CouchDB response latency exceeds `max_latency` the
+    pauses grow twice, and shrink back while latency stays below it.
+    """
+
+    def __init__(self, docs_per_second=0, writes_per_second=0, max_latency=0):
+        self.docs_per_second = docs_per_second
+        self.writes_per_second = writes_per_second
+        self.max_latency = max_latency
+        self.slowdown = 1.0
+        self.rate = 0.0
+        self.total = 0
+        self.scanned = 0
+        self.writes = 0
+        self.last_read = self.last_write = time()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(float(settings.get('migration.throttle.docs_per_second', 0)),
+                   float(settings.get('migration.throttle.writes_per_second', 0)),
+                   float(settings.get('migration.throttle.max_latency', 0)))
+
+    @property
+    def backlog(self):
+        return max(self.total - self.scanned, 0)
+
+    def status(self):
+        return {
+            'rate': self.rate,
+            'backlog': self.backlog,
+            'scanned': self.scanned,
+            'writes': self.writes,
+            'slowdown': self.slowdown,
+        }
+
+    def reset(self, total):
+        """ Start throttling of migration step over `total` contracts """
+        self.total = total
+        self.scanned = 0
+
+    def read(self, count, latency):
+        """ Pause after `count` contracts were read in `latency` seconds """
+        self.scanned += count
+        self.backoff(latency)
+        interval = float(count) / self.docs_per_second if self.docs_per_second else 0
+        now = time()
+        if now > self.last_read:
+            self.rate = 0.8 * self.rate + 0.2 * count / (now - self.last_read)
+        self.last_read = self.pause(self.last_read, interval, latency)
+
+    def write(self, latency):
+        """ Pause after bulk write done in `latency` seconds """
+        self.writes += 1
+        self.backoff(latency)
+        interval = 1.0 / self.writes_per_second if self.writes_per_second else 0
+        self.last_write = self.pause(self.last_write, interval, latency)
+
+    def backoff(self, latency):
+        if self.max_latency and latency > self.max_latency:
+            self.slowdown = min(self.slowdown * 2, MAX_SLOWDOWN)
+        else:
+            self.slowdown = max(self.slowdown / 2, 1.0)
+
+    def pause(self, last, interval, latency):
+        delay = max(last + interval * self.slowdown - time(), latency * (self.slowdown - 1))
+        if delay > 0:
+            sleep(delay)
+        return time()
+
+
+class MigrationScheduler(Thread):
+    """ Background migration running along with the API.
+
+    Runs remaining migration steps throttled by `throttle`, updating
+    database schema version after each one. Current step, rate and backlog
+    are available from `status`.
+    """
+
+    def __init__(self, registry, destination=None, throttle=None):
+        super(MigrationScheduler, self).__init__(name='MigrationScheduler')
+        self.daemon = True
+        self.registry = registry
+        self.destination = destination or SCHEMA_VERSION
+        self.throttle = throttle or Throttle()
+        self.step = None
+
+    def status(self):
+        return dict(self.throttle.status(), step=self.step)
+
+    def run(self):
+        db = self.registry.db
+        try:
+            for step in xrange(get_db_schema_version(db), self.destination):
+                migration_func = globals().get('from{}to{}'.format(step, step + 1))
+                if migration_func:
+                    self.step = migration_func.__name__
+                    self.throttle.reset(db.view('contracts/all', limit=0).total_rows)
+                    # key ranges are not run in parallel to keep the limits
+                    run_migration_step(self.registry, migration_func, throttle=self.throttle)
+                set_db_schema_version(db, step + 1)
+                self.registry.contracts_schema_version = step + 1
+                LOGGER.info("Contracts schema migrated from {} to {} in background.".
+                            format(step, step + 1), extra={'MESSAGE_ID': 'migrate_data'})
+        except Exception:
+            LOGGER.exception("Background contracts migration failed.", extra={'MESSAGE_ID': 'migrate_data'})
+        self.step = None
+
+
+def dry_run_step(registry, migration_func, workers=1, **options):
+    """ Run migration step without saving and report its expected cost.
+
+    Report contains number of contracts scanned and scan rate, number and
+    JSON size of contracts which would be updated, and wall time projected
+    for all contracts in database (writes excluded).
+    """
+    total = registry.db.view('contracts/all', limit=0).total_rows
+    start = time()
+    stats = run_migration_step(registry, migration_func, workers, dry_run=True, **options)
+    seconds = time() - start
+    rate = stats['scanned'] / seconds if seconds else 0
+    report = {
+        'step': migration_func.__name__,
+        'total': total,
+        'scanned': stats['scanned'],
+        'updated': stats['updated'],
+        'size': stats['size'],
+        'seconds': seconds,
+        'docs_per_second': rate,
+        'projected_seconds': total / rate if rate else 0,
+    }
+    LOGGER.info("Migration {step} dry run: {scanned} of {total} contracts scanned in {seconds:.1f}s "
+                "({docs_per_second:.1f}/s), {updated} to update ({size} bytes), "
+                "projected time {projected_seconds:.1f}s.".format(**report),
+                extra={'MESSAGE_ID': 'migrate_data'})
+    return report
+
+
+def get_key_ranges(db, parts):
+    """ Split `contracts/all` keys into `parts` ranges of nearly equal size.
+
+    Returns a list of view options (startkey/endkey) for each range.
+    """
+    total = db.view('contracts/all', limit=0).total_rows
+    keys = []
+    for part in xrange(1, parts):
+        rows = db.view('contracts/all', skip=part * total // parts, limit=1).rows
+        if rows and (not keys or rows[0].key != keys[-1]):
+            keys.append(rows[0].key)
+    ranges = []
+    for startkey, endkey in zip([None] + keys, keys + [None]):
+        options = {}
+        if startkey is not None:
+            options['startkey'] = startkey
+        if endkey is not None:
+            options.update(endkey=endkey, inclusive_end=False)
+        ranges.append(options)
+    return ranges
+
+
+class WorkerRegistry(object):
+    """ Registry proxy with database connection owned by worker process """
+
+    def __init__(self, registry):
+        self._registry = registry
+        resource = Resource(registry.db.resource.url, Session())
+        resource.credentials = registry.db.resource.credentials
+        self.db = Database(resource, registry.db.name)
+
+    def __getattr__(self, name):
+        return getattr(self._registry, name)
+
+
+def _init_worker():
+    global _registry
+    _registry = WorkerRegistry(_registry)
+
+
+def _migrate_range(args):
+    step_name, options = args
+    return globals()[step_name](_registry, **options)
+
+
+def run_migration_step(registry, migration_func, workers=1, dry_run=False, **options):
+    """ Run migration step over `contracts/all` key ranges.
+
+    With more than one worker key ranges are processed by a pool of
+    `workers` processes, each one writing with its own database connection.
+    Key ranges of interrupted step are restored from `SCHEMA_DOC`, so its
+    checkpoints stay valid. Returns counters summed over all ranges.
+    """
+    step = migration_func.__name__
+    # make sure view is indexed before splitting it and forking workers
+    len(registry.db.view('contracts/all', limit=1))
+    ranges = None if dry_run else get_migration_state(registry.db, step).get("ranges")
+    if ranges is None:
+        ranges = [{}]
+        if workers > 1:
+            ranges = get_key_ranges(registry.db, workers * RANGES_PER_WORKER)
+            if not dry_run:
+                update_migration_state(registry.db, step, ranges=ranges)
+    tasks = [(step, dict(range_options, part=part, dry_run=dry_run, **options))
+             for part, range_options in enumerate(ranges)]
+    stats = Counter()
+    if workers <= 1:
+        for task in tasks:
+            stats.update(globals()[step](registry, **task[1]))
+        return stats
+    global _registry
+    _registry = registry
+    pool = Pool(workers, _init_worker)
+    try:
+        for done, range_stats in enumerate(pool.imap_unordered(_migrate_range, tasks), 1):
+            stats.update(range_stats)
+            LOGGER.info("Migration {}: {}/{} key ranges done, {} contracts scanned, {} updated.".
+                        format(step, done, len(ranges), stats['scanned'], stats['updated']),
+                        extra={'MESSAGE_ID': 'migrate_data'})
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _registry = None
+    return stats
+
+
+def get_tenders_awards(db, tender_ids, cache=None):
+    """ Get awards mapping (award id -> award) for each of `tender_ids`.
+
+    Tenders missing in `cache` (if given) are fetched with one multi-key
+    `_all_docs` request.
+    """
+    awards = {}
+    missing = []
+    for tender_id in set(tender_ids):
+        tender_awards = cache.get(tender_id) if cache is not None else None
+        if tender_awards is None:
+            missing.append(tender_id)
+        else:
+            awards[tender_id] = tender_awards
+    if missing:
+        for row in db.view('_all_docs', keys=missing, include_docs=True):
+            tender_awards = dict([(aw['id'], aw) for aw in (row.doc or {}).get('awards', [])])
+            if cache is not None:
+                cache.put(row.key, tender_awards)
+            awards[row.key] = tender_awards
+    return awards
+
+
+class BulkWriter(Thread):
+    """ Background writer of migrated documents.
+
+    Documents are taken from a bounded queue and saved with `_bulk_docs`
+    requests. Batch size is halved when a write takes longer than
+    `target_latency` and doubled when it takes less than half of it.
+    Documents rejected with conflict are migrated again from their latest
+    revision and saved one by one.
+    """
+
+    def __init__(self, db, migrate_docs, on_write=None, target_latency=WRITE_LATENCY, throttle=None):
+        super(BulkWriter, self).__init__()
+        self.daemon = True
+        self.db = db
+        self.migrate_docs = migrate_docs
+        self.on_write = on_write
+        self.target_latency = target_latency
+        self.throttle = throttle
+        self.queue = Queue(WRITE_QUEUE_SIZE)
+        self.batch_size = 2 ** 7
+        self.updated = 0
+        self.writes = 0
+        self.error = None
+
+    def put(self, doc):
+        if self.error:
+            raise self.error
+        self.queue.put((doc, None))
+
+    def mark(self, progress):
+        """ Mark that all documents put before `progress` was read """
+        self.queue.put((None, progress))
+
+    def close(self):
+        self.queue.put((None, None))
+        self.join()
+
+    def run(self):
+        docs = []
+        progress = None
+        while True:
+            doc, mark = self.queue.get()
+            if doc is None and mark is None:
+                break
+            if self.error:
                 continue
-            rel_award = rel_award[0]
+            try:
+                if doc is None:
+                    progress = mark
+                    continue
+                docs.append(doc)
+                if len(docs) >= self.batch_size:
+                    self.flush(docs, progress)
+                    docs = []
+            except Exception as e:
+                LOGGER.exception("Migration writer failed.", extra={'MESSAGE_ID': 'migrate_data'})
+                self.error = e
+        if docs and not self.error:
+            try:
+                self.flush(docs, progress)
+            except Exception as e:
+                LOGGER.exception("Migration writer failed.", extra={'MESSAGE_ID': 'migrate_data'})
+                self.error = e
+
+    def flush(self, docs, progress):
+        start = time()
+        results = self.db.update(docs)
+        latency = time() - start
+        self.tune(latency)
+        if self.throttle:
+            self.throttle.write(latency)
+        for success, docid, rev_or_exc in results:
+            if success:
+                self.updated += 1
+            elif isinstance(rev_or_exc, ResourceConflict):
+                self.updated += self.retry(docid)
+            else:
+                LOGGER.warn("Contract {} was not saved: {}".format(docid, rev_or_exc),
+                            extra={'MESSAGE_ID': 'migrate_data'})
+        self.writes += 1
+        if self.on_write:
+            self.on_write(self, progress)
+
+    def tune(self, latency):
+        if latency > self.target_latency:
+            self.batch_size = max(self.batch_size // 2, MIN_WRITE_BATCH)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.batch_size * 2, MAX_WRITE_BATCH)
+
+    def retry(self, docid):
+        for attempt in xrange(CONFLICT_RETRIES):
+            doc = self.db.get(docid)
+            docs = list(self.migrate_docs([doc])) if doc else []
+            if not docs:
+                return 0
+            try:
+                self.db.save(docs[0])
+            except ResourceConflict:
+                continue
+            return 1
+        LOGGER.warn("Contract {} was not saved due to conflicts".format(docid),
+                    extra={'MESSAGE_ID': 'migrate_data'})
+        return 0
+
+
+def dry_run_contracts(registry, migrate_docs, **options):
+    """ Run `migrate_docs` over contracts without saving them """
+    # utils imports this module
+    from openprocurement.contracting.core.utils import iterview_pages
+    stats = Counter(scanned=0, updated=0, size=0)
+    for page in iterview_pages(registry.db, 2 ** 10, include_docs=True, **options):
+        for doc in migrate_docs([i.doc for i in page]):
+            stats['updated'] += 1
+            stats['size'] += len(json.encode(doc))
+        stats['scanned'] += len(page)
+    return stats
+
+
+def migrate_contracts(registry, step, migrate_docs, part=0, dry_run=False, throttle=None, **options):
+    """ Save contracts changed by `migrate_docs` with `BulkWriter`.
+
+    `migrate_docs` gets documents of each `contracts/all` page and yields
+    documents to be saved. Every `migration.checkpoint_interval` bulk
+    writes the key of the last fully saved page is stored as checkpoint
+    of (`step`, `part`), and the next run of the step resumes from it.
+    Reads and writes are paced by `throttle` if given.
+    Returns scanned and updated contracts counters.
+    """
+    if dry_run:
+        return dry_run_contracts(registry, migrate_docs, **options)
+    # utils imports this module
+    from openprocurement.contracting.core.utils import iterview_pages
+    settings = registry.settings
+    interval = int(settings.get('migration.checkpoint_interval', CHECKPOINT_INTERVAL))
+    checkpoint = get_checkpoint(registry.db, step, part)
+    scanned = checkpoint.get('scanned', 0)
+    updated = checkpoint.get('updated', 0)
+    if checkpoint.get('done'):
+        return Counter(scanned=scanned, updated=updated)
+    if checkpoint:
+        LOGGER.info("Resume migration {} from {} ({} contracts scanned, {} updated).".
+                    format(step, checkpoint['startkey'], scanned, updated),
+                    extra={'MESSAGE_ID': 'migrate_data'})
+        options.update(startkey=checkpoint['startkey'], startkey_docid=checkpoint['startkey_docid'])
+
+    def on_write(writer, progress):
+        if progress and writer.writes % interval == 0:
+            set_checkpoint(registry.db, step, part, dict(progress, updated=updated + writer.updated))
+
+    writer = BulkWriter(registry.db, migrate_docs, on_write,
+                        float(settings.get('migration.write_latency', WRITE_LATENCY)), throttle)
+    writer.start()
+    try:
+        start = time()
+        for page in iterview_pages(registry.db, 2 ** 10, include_docs=True, **options):
+            if throttle:
+                throttle.read(len(page), time() - start)
+            for doc in migrate_docs([i.doc for i in page]):
+                writer.put(doc)
+            scanned += len(page)
+            writer.mark({'startkey': page[-1].key, 'startkey_docid': page[-1].id, 'scanned': scanned})
+            start = time()
+    finally:
+        writer.close()
+    if writer.error:
+        raise writer.error
+    updated += writer.updated
+    set_checkpoint(registry.db, step, part, {'done': True, 'scanned': scanned, 'updated': updated})
+    return Counter(scanned=scanned, updated=updated)
+
+
+def upgrade0to1(registry, doc, awards=None):
+    """ Copy suppliers and value of contract award from its tender.
+
+    `awards` are tenders awards fetched by `get_tenders_awards`, tender of
+    the contract is fetched if they are not given, through expiring cache
+    of lazy migration if it is enabled.
+    """
+    if "suppliers" in doc:
+        return
+    if awards is None or doc['tender_id'] not in awards:
+        awards = get_tenders_awards(registry.db, [doc['tender_id']],
+                                    getattr(registry, 'contracts_tenders_cache', None))
+    rel_award = awards[doc['tender_id']].get(doc['awardID'])
+    if not rel_award:
+        LOGGER.warn("Related award {} for contract {} not found!".
+                    format(doc['awardID'], doc['id']), extra={'MESSAGE_ID': 'migrate_data'})
+        return
 
-            doc['suppliers'] = rel_award['suppliers']
-            if "value" not in doc:
-                doc['value'] = rel_award['value']
+    doc['suppliers'] = rel_award['suppliers']
+    if "value" not in doc:
+        doc['value'] = rel_award['value']
+    return doc
 
-            doc['dateModified'] = get_now().isoformat()
 
-            docs.append(doc)
-        if len(docs) >= 2 ** 7:
-            registry.db.update(docs)
-            docs = []
-    if docs:
-        registry.db.update(docs)
+def from0to1(registry, **options):
+    LOGGER.info("Start contracts migration.", extra={'MESSAGE_ID': 'migrate_data'})
+    # tenders are cached for this run only, they may change afterwards
+    cache = LRUCache(TENDERS_CACHE_SIZE)
+
+    def migrate_docs(docs):
+        docs = [doc for doc in docs if doc.get('schemaVersion', 0) < 1 and "suppliers" not in doc]
+        # fetch tenders of the whole page with one request
+        awards = get_tenders_awards(registry.db, [doc['tender_id'] for doc in docs], cache)
+        for doc in docs:
+            doc = upgrade0to1(registry, doc, awards)
+            if doc:
+                doc['schemaVersion'] = 1
+                doc['dateModified'] = get_now().isoformat()
+                yield doc
+
+    stats = migrate_contracts(registry, 'from0to1', migrate_docs, **options)
     LOGGER.info("Contracts migration is finished.", extra={'MESSAGE_ID': 'migrate_data'})
+    return stats
 
 
-def from1to2(registry):
-    class Request(object):
-        def __init__(self, registry):
-            self.registry = registry
-    len(registry.db.view('contracts/all', limit=1))
-    results = registry.db.iterview('contracts/all', 2 ** 10, include_docs=True, stale='update_after')
-    docs = []
+class Request(object):
+    """ Request stand-in to serialize models outside of the API """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+
+def migrate_documents_model(root, doc):
+    """ Rewrite document urls of contract `doc` with `Contract` model """
+    contract = Contract(doc)
+    contract.__parent__ = root
+    return contract.to_primitive()
+
+
+def document_download_url(request, document):
+    """ Return `url` of raw `document` as `Document.download_url` does.
+
+    Document service prefix is made of the first and the last ids in the
+    stored url path, documents with `hash` get no prefix.
+    """
+    url = document.get('url')
+    if not url or '?download=' not in url or not request.registry.docservice_url:
+        return url
+    key = parse_qs(urlparse(url).query)['download'][-1]
+    if document.get('hash'):
+        return generate_docservice_url(request, key, False)
+    path = [i for i in urlparse(url).path.split('/') if len(i) == 32 and not set(i).difference(hexdigits)]
+    return generate_docservice_url(request, key, False, '{}/{}'.format(path[0], path[-1]))
+
+
+def migrate_documents_dict(request, doc):
+    """ Rewrite document urls of contract `doc` in place.
+
+    Only `documents[*].url` are changed, the same way
+    `Document.download_url` serializes them. Urls of contracts with status
+    naming a model role depend on that role, they are left to the model.
+    """
+    if doc.get('status') in Contract._options.roles:
+        return migrate_documents_model(Root(request), doc)
+    for document in doc.get('documents', []):
+        if 'url' in document:
+            document['url'] = document_download_url(request, document)
+    return doc
+
+
+def diff_paths(first, second, path=''):
+    """ Get paths of values differing in `first` and `second` """
+    if isinstance(first, dict) and isinstance(second, dict):
+        paths = []
+        for key in sorted(set(first) | set(second)):
+            paths.extend(diff_paths(first.get(key), second.get(key), '{}/{}'.format(path, key)))
+        return paths
+    if isinstance(first, list) and isinstance(second, list) and len(first) == len(second):
+        paths = []
+        for index, (i, j) in enumerate(zip(first, second)):
+            paths.extend(diff_paths(i, j, '{}/{}'.format(path, index)))
+        return paths
+    return [] if first == second else [path or '/']
+
+
+def check_from1to2(registry, limit=100):
+    """ Compare dict and model modes of from1to2 on a sample of contracts.
+
+    Returns list of (contract id, path) pairs for values which differ.
+    """
     request = Request(registry)
     root = Root(request)
-    for i in results:
-        doc = i.doc
-        if not all([i.get('url', '').startswith(registry.docservice_url) for i in doc.get('documents', [])]):
-            contract = Contract(doc)
-            contract.__parent__ = root
-            doc = contract.to_primitive()
-            doc['dateModified'] = get_now().isoformat()
-            docs.append(doc)
-        if len(docs) >= 2 ** 7:
-            registry.db.update(docs)
-            docs = []
-    if docs:
-        registry.db.update(docs)
+    mismatches = []
+    for row in registry.db.view('contracts/all', limit=limit, include_docs=True):
+        doc = row.doc
+        if all([i.get('url', '').startswith(registry.docservice_url) for i in doc.get('documents', [])]):
+            continue
+        model_doc = migrate_documents_model(root, deepcopy(doc))
+        dict_doc = migrate_documents_dict(request, deepcopy(doc))
+        mismatches.extend([(doc['_id'], path) for path in diff_paths(model_doc, dict_doc)])
+    return mismatches
+
+
+def upgrade1to2(registry, doc):
+    if all([i.get('url', '').startswith(registry.docservice_url) for i in doc.get('documents', [])]):
+        return
+    request = Request(registry)
+    if registry.settings.get('migration.from1to2') == 'dict':
+        return migrate_documents_dict(request, doc)
+    return migrate_documents_model(Root(request), doc)
+
+
+def from1to2(registry, **options):
+    len(registry.db.view('contracts/all', limit=1))
+
+    def migrate_docs(docs):
+        for doc in docs:
+            if doc.get('schemaVersion', 1) < 2:
+                doc = upgrade1to2(registry, doc)
+                if doc:
+                    doc['schemaVersion'] = 2
+                    doc['dateModified'] = get_now().isoformat()
+                    yield doc
+
+    return migrate_contracts(registry, 'from1to2', migrate_docs, stale='update_after', **options)
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from copy import copy
+from itertools import chain
 from uuid import uuid4
 from zope.interface import implementer, Interface
 from couchdb_schematics.document import SchematicsDocument
 from pyramid.security import Allow
-from schematics.types import StringType, BaseType, MD5Type
+from schematics.types import StringType, BaseType, MD5Type, IntType
 from schematics.types.compound import ModelType, DictType
-from schematics.types.serializable import serializable
-from schematics.exceptions import ValidationError
-from schematics.transforms import whitelist, blacklist
+from schematics.types.serializable import serializable, Serializable
+from schematics.exceptions import ValidationError, ConversionError, ModelConversionError
+from schematics.transforms import (whitelist, blacklist, wholelist, export_loop,
+                                   allow_none, sort_dict, Role)
 
 from openprocurement.api.constants import SANDBOX_MODE
 from openprocurement.api.utils import get_now
@@ -27,6 +31,7 @@ from openprocurement.api.models import (
     schematics_embedded_role
 )
 from openprocurement.tender.core.models import Administrator_role
+from openprocurement.contracting.core.revisions import archive_stored_revisions
 
 contract_create_role = (whitelist(
     'id', 'awardID', 'contractID', 'contractNumber', 'title', 'title_en',
@@ -56,17 +61,254 @@ item_edit_role = whitelist(
     'deliveryAddress', 'deliveryLocation', 'quantity', 'id')
 
 
+COMPILED_ROLE_FUNCTIONS = (Role.whitelist, Role.blacklist, Role.wholelist)
+_compiled_exports = {}
+
+
+def compile_export(cls, role=None, raise_error_on_role=False):
+    """ Build export function of `cls` model for `role`.
+
+    Role filter is applied once on compile, so export walks only the fields
+    left by the role. Nested models are exported with compiled functions
+    too. Output is the same as of `schematics.transforms.export_loop`,
+    roles with custom filter functions fall back to it. Export may be
+    limited to `fields` given by serialized names.
+    """
+    key = (cls, role, raise_error_on_role)
+    if key in _compiled_exports:
+        return _compiled_exports[key]
+    if role in cls._options.roles:
+        gottago = cls._options.roles[role]
+    elif role and raise_error_on_role:
+        raise ValueError(u'%s Model has no role "%s"' % (cls.__name__, role))
+    else:
+        gottago = cls._options.roles.get('default', wholelist())
+    if getattr(gottago, 'function', None) not in COMPILED_ROLE_FUNCTIONS:
+        def export(instance, field_converter, print_none=False, fields=None):
+            data = export_loop(cls, instance, field_converter, role=role,
+                               raise_error_on_role=raise_error_on_role, print_none=print_none)
+            if data and fields is not None:
+                data = dict([(k, v) for k, v in data.items() if k in fields])
+            return data
+        _compiled_exports[key] = export
+        return export
+
+    plan = [
+        (name, field.serialized_name or name, field, _compile_field_export(field), allow_none(cls, field))
+        for name, field in chain(cls._fields.items(), cls._serializables.items())
+        if not gottago(name, None)
+    ]
+    fields_order = getattr(cls._options, 'fields_order', None)
+
+    def export(instance, field_converter, print_none=False, fields=None):
+        data = {}
+        for name, serialized_name, field, field_export, allowed in plan:
+            if fields is not None and serialized_name not in fields:
+                continue
+            value = instance[name]
+            if value is not None:
+                if field_export is not None:
+                    value = field_export(value, field_converter, role=role, print_none=print_none)
+                else:
+                    value = field_converter(field, value)
+            if value is not None or allowed or print_none:
+                data[serialized_name] = value
+        if data:
+            return sort_dict(data, fields_order) if fields_order else data
+        elif print_none:
+            return data
+
+    _compiled_exports[key] = export
+    return export
+
+
+def _compile_model_export(field):
+    """ Compiled replacement of `ModelType.export_loop` """
+    def export(model_instance, field_converter, role=None, print_none=False):
+        if isinstance(model_instance, field.model_class):
+            model_class = model_instance.__class__
+        else:
+            model_class = field.model_class
+        shaped = compile_export(model_class, role)(model_instance, field_converter, print_none)
+        if shaped or print_none:
+            return shaped
+    return export
+
+
+def _compile_field_export(field):
+    if type(field) is ModelType:
+        return _compile_model_export(field)
+    if isinstance(field, Serializable) and type(field.type) is ModelType:
+        return _compile_model_export(field.type)
+    if type(getattr(field, 'field', None)) is ModelType and hasattr(field, 'export_loop'):
+        # list or dict of models, items are exported with compiled function
+        field = copy(field)
+        field.field = copy(field.field)
+        field.field.export_loop = _compile_model_export(field.field)
+    return getattr(field, 'export_loop', None)
+
+
+def export_compiled(cls, instance, field_converter, role=None, raise_error_on_role=False, print_none=False,
+                    fields=None):
+    """ Same as `schematics.transforms.export_loop` using compiled exports """
+    return compile_export(cls, role, raise_error_on_role)(instance, field_converter, print_none, fields)
+
+
+class CompiledSerializerMixin(object):
+    """ Serialize model with export function compiled for its class and role """
+
+    def serialize(self, role=None, context=None, fields=None):
+        field_converter = lambda field, value: field.to_primitive(value, context=context)
+        return export_compiled(self.__class__, self, field_converter, role=role, raise_error_on_role=True,
+                               fields=fields)
+
+
+# requests not changing contracts, see Contract.serialize
+CACHED_METHODS = ('GET', 'HEAD')
+
+LAZY_FIELDS = ('documents', 'changes', 'items', 'revisions', 'suppliers',
+               'procuringEntity', 'value', 'period', 'amountPaid', '_attachments')
+
+
+def touched_fields(cls, raw_data):
+    """ Names of `cls` fields having values in `raw_data` """
+    fields = set()
+    for name, field in cls._fields.items():
+        keys = field.deserialize_from or []
+        keys = [keys] if isinstance(keys, basestring) else list(keys)
+        if any([key in raw_data for key in [name, field.serialized_name] + keys]):
+            fields.add(name)
+    return fields
+
+
+def validation_dependencies(cls):
+    """ `validation_dependencies` inherited by `cls`, None when it adds rules
+
+    Subclasses keep the dependencies of the class declaring them, unless
+    they change its model validators or compound fields. New scalar fields
+    are checked by themselves only.
+    """
+    base = next((i for i in cls.__mro__ if 'validation_dependencies' in i.__dict__), None)
+    if base is None:
+        return None
+    for name in set(cls._validator_functions) | set(base._validator_functions):
+        if cls._validator_functions.get(name) is not base._validator_functions.get(name):
+            return None
+    for name, field in cls._fields.items():
+        if base._fields.get(name) is not field and hasattr(field, 'export_loop'):
+            return None
+    return base.validation_dependencies
+
+
+class LazyData(dict):
+    """ Model data keeping raw values of `pending` fields until first access.
+
+    `hydrate(name, raw_value)` converts a raw value. Methods returning
+    values convert all pending fields first.
+    """
+
+    def __init__(self, data, pending, hydrate):
+        super(LazyData, self).__init__(data)
+        self.pending = set(pending)
+        self.hydrate = hydrate
+
+    def __getitem__(self, key):
+        if key in self.pending:
+            value = self.hydrate(key, dict.__getitem__(self, key))
+            dict.__setitem__(self, key, value)
+            self.pending.discard(key)
+            return value
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.pending.discard(key)
+        dict.__delitem__(self, key)
+
+    def hydrate_all(self):
+        for key in list(self.pending):
+            self[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key in self:
+            self[key]
+        return dict.pop(self, key, *default)
+
+    def update(self, *args, **kwargs):
+        data = dict(*args, **kwargs)
+        self.pending.difference_update(data)
+        dict.update(self, data)
+
+    def items(self):
+        self.hydrate_all()
+        return dict.items(self)
+
+    def iteritems(self):
+        self.hydrate_all()
+        return dict.iteritems(self)
+
+    def values(self):
+        self.hydrate_all()
+        return dict.values(self)
+
+    def itervalues(self):
+        self.hydrate_all()
+        return dict.itervalues(self)
+
+    def copy(self):
+        return LazyData(dict.copy(self), self.pending, self.hydrate)
+
+
 class IContract(Interface):
     """ Contract marker interface """
 
 
-def get_contract(model):
-    while not IContract.providedBy(model):
-        model = model.__parent__
-    return model
+_contract_classes = {}
+
 
+def is_contract(model):
+    """ `IContract.providedBy` for models, cached per class """
+    cls = type(model)
+    if cls not in _contract_classes:
+        _contract_classes[cls] = IContract.implementedBy(cls)
+    return _contract_classes[cls]
 
-class Document(BaseDocument):
+
+def get_contract(model):
+    """ Return contract owning `model`.
+
+    Chain of parents up to the contract is cached in the model, and is used
+    while each of them still has the same parent, so the chain is walked
+    again after the model or any of its parents is re-parented.
+    """
+    if is_contract(model):
+        return model
+    chain = model.__dict__.get('_contract_chain')
+    if chain is not None:
+        node = model
+        for parent in chain:
+            if node.__parent__ is not parent:
+                break
+            node = parent
+        else:
+            return node
+    chain = []
+    node = model.__parent__
+    while not is_contract(node):
+        chain.append(node)
+        node = node.__parent__
+    chain.append(node)
+    model._contract_chain = tuple(chain)
+    return node
+
+
+class Document(CompiledSerializerMixin, BaseDocument):
     """ Contract Document """
     documentOf = StringType(required=True, choices=[
         'tender', 'item', 'lot', 'contract', 'change'], default='contract')
@@ -76,9 +318,9 @@ class Document(BaseDocument):
             raise ValidationError(u'This field is required.')
         if relatedItem and isinstance(data['__parent__'], Model):
             contract = get_contract(data['__parent__'])
-            if data.get('documentOf') == 'change' and relatedItem not in [i.id for i in contract.changes]:
+            if data.get('documentOf') == 'change' and contract.get_related('change', relatedItem) is None:
                 raise ValidationError(u"relatedItem should be one of changes")
-            if data.get('documentOf') == 'item' and relatedItem not in [i.id for i in contract.items]:
+            if data.get('documentOf') == 'item' and contract.get_related('item', relatedItem) is None:
                 raise ValidationError(u"relatedItem should be one of items")
 
 
@@ -130,7 +372,7 @@ class Item(BaseItem):
     additionalClassifications = ListType(ModelType(AdditionalClassification, default=list()))
 
 
-class Change(Model):
+class Change(CompiledSerializerMixin, Model):
     class Options:
         roles = {
             # 'edit': blacklist('id', 'date'),
@@ -162,7 +404,7 @@ class Change(Model):
 
 
 @implementer(IContract)
-class Contract(SchematicsDocument, BaseContract):
+class Contract(CompiledSerializerMixin, SchematicsDocument, BaseContract):
     """ Contract """
 
     revisions = ListType(ModelType(Revision), default=list())
@@ -183,14 +425,22 @@ class Contract(SchematicsDocument, BaseContract):
     documents = ListType(ModelType(Document), default=list())
     amountPaid = ModelType(Value)
     terminationDetails = StringType()
+    schemaVersion = IntType()  # set when document is upgraded by migration
+    revisionsArchived = IntType()  # number of revisions moved to revisions documents
 
     create_accreditation = 3  # TODO
+    # fields validated again when a patch changes the key field, see
+    # validation_dependencies for subclasses
+    validation_dependencies = {
+        'items': ('documents',),
+        'changes': ('documents',),
+    }
     if SANDBOX_MODE:
         procurementMethodDetails = StringType()
 
     class Options:
         roles = {
-            'plain': plain_role,
+            'plain': plain_role + blacklist('schemaVersion', 'revisionsArchived'),
             'create': contract_create_role,
             'edit_active': contract_edit_role,
             'edit_terminated': whitelist(),
@@ -199,6 +449,108 @@ class Contract(SchematicsDocument, BaseContract):
             'default': schematics_default_role,
         }
 
+    def __init__(self, raw_data=None, *args, **kwargs):
+        """ `lazy_fields` keyword lists fields converted on first access,
+        see LAZY_FIELDS.
+        """
+        lazy_fields = kwargs.pop('lazy_fields', ())
+        lazy = {}
+        if raw_data and lazy_fields:
+            lazy = dict([(k, raw_data[k]) for k in lazy_fields
+                         if k in self._fields and raw_data.get(k) is not None])
+            raw_data = dict([(k, v) for k, v in raw_data.items() if k not in lazy])
+        super(Contract, self).__init__(raw_data, *args, **kwargs)
+        if lazy:
+            self._initial = dict(raw_data, **lazy)
+            self._data = LazyData(dict(self._data, **lazy), lazy, self._hydrate)
+
+    def _hydrate(self, name, raw_value):
+        """ Convert raw value of lazy field `name` """
+        try:
+            value = self._fields[name].to_native(raw_value)
+        except ConversionError as e:
+            raise ModelConversionError({name: e.messages})
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, Model) and getattr(item, '__parent__', None) is None:
+                item.__parent__ = self
+        return value
+
+    def get_request(self):
+        """ Request of the application contract is loaded by, if any """
+        return getattr(getattr(self, '__parent__', None), 'request', None)
+
+    def get_registry(self):
+        """ Registry of the application contract is loaded by, if any """
+        return getattr(self.get_request(), 'registry', None)
+
+    def serialize(self, role=None, context=None, fields=None):
+        """ Serialize contract, stored contracts are serialized through
+        `contract_serialize_cache` of the registry for read-only requests
+        only: other ones may change the contract before serializing it.
+        """
+        request = self.get_request()
+        cache = getattr(getattr(request, 'registry', None), 'contract_serialize_cache', None)
+        if cache is None or getattr(request, 'method', None) not in CACHED_METHODS or not self._rev \
+                or context is not None or fields is not None or role not in cache.roles:
+            return super(Contract, self).serialize(role, context, fields)
+        key = (self.__class__.__name__, self.id, self._rev, role)
+        data = cache.get(key)
+        if data is None:
+            data = super(Contract, self).serialize(role)
+            cache.put(key, data)
+        return data
+
+    def to_store(self, database, validate=True, role=None):
+        """ Return document to save to `database`, prepared the same way
+        for `store` and bulk saves.
+        """
+        if validate:
+            self.validate()
+        return self.to_primitive(role=role)
+
+    def store(self, database, validate=True, role=None):
+        self._id, self._rev = database.save(self.to_store(database, validate, role))
+        # old revisions are moved out only once they are saved
+        tail = getattr(self.get_registry(), 'contract_revisions_tail', None)
+        if tail is not None:
+            archive_stored_revisions(database, self, tail, role)
+        return self
+
+    def get_related(self, kind, related_id):
+        """ Return contract item or change (`kind`) with `related_id`.
+
+        Inside `related_index` block lookups use index of the list built on
+        first lookup, otherwise the list is scanned.
+        """
+        related = (self.items if kind == 'item' else self.changes) or []
+        index = self.__dict__.get('_related_index')
+        if index is None:
+            for i in related:
+                if i.id == related_id:
+                    return i
+            return None
+        if kind not in index:
+            index[kind] = dict([(i.id, i) for i in related])
+        return index[kind].get(related_id)
+
+    @contextmanager
+    def related_index(self):
+        """ Index items and changes by id for `get_related` lookups inside
+        the block, they must not be changed there.
+        """
+        if '_related_index' in self.__dict__:
+            yield
+            return
+        self._related_index = {}
+        try:
+            yield
+        finally:
+            del self._related_index
+
+    def validate(self, *args, **kwargs):
+        with self.related_index():
+            return super(Contract, self).validate(*args, **kwargs)
+
     def __local_roles__(self):
         return dict([('{}_{}'.format(self.owner, self.owner_token), 'contract_owner'),
                      ('{}_{}'.format(self.owner, self.tender_token), 'tender_owner')])
@@ -214,12 +566,15 @@ class Contract(SchematicsDocument, BaseContract):
     def import_data(self, raw_data, **kw):
         """
         Converts and imports the raw data into the instance of the model
-        according to the fields in the model.
+        according to the fields in the model. Only fields present in raw
+        data are compared with current values.
         :param raw_data:
             The data to be imported.
         """
         data = self.convert(raw_data, **kw)
-        del_keys = [k for k in data.keys() if data[k] == self.__class__.fields[k].default or data[k] == getattr(self, k)]
+        fields = touched_fields(self.__class__, raw_data)
+        del_keys = [k for k in data.keys() if k not in fields or data[k] == self.__class__.fields[k].default
+                    or data[k] == getattr(self, k)]
         for k in del_keys:
             del data[k]
 
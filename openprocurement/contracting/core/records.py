@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+""" Compact read-only records of stored contracts.
+
+Records are built from raw documents with classes generated once per model
+class. They keep values in slots instead of instance dicts, keep primitive
+values as stored, with lists as tuples and dicts as `FrozenDict`, and are
+meant for batch export and reporting jobs which only read contracts::
+
+    for record in iter_contract_records(db):
+        report(record.contractID, record.procuringEntity.name)
+
+Loaders share one record of equal procuring entities and suppliers
+between contracts through `Interner`.
+"""
+import json
+from hashlib import md5
+
+from repoze.lru import LRUCache
+from schematics.types.compound import ModelType, ListType
+
+from openprocurement.contracting.core.utils import iterview_pages
+from openprocurement.contracting.core.models import Contract
+
+PAGE_SIZE = 2 ** 8
+INTERN_CACHE_SIZE = 2 ** 12
+INTERNED_FIELDS = ('procuringEntity', 'suppliers')
+_record_classes = {}
+
+
+class Record(object):
+    """ Read-only record of a model, see `record_class` """
+    __slots__ = ()
+    _converters = ()
+
+    def __init__(self, data, interner=None):
+        for key, converter in self._converters:
+            value = data.get(key)
+            if value is not None:
+                value = converter(value, interner)
+            object.__setattr__(self, key, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} record is read-only'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} record is read-only'.format(type(self).__name__))
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all([
+            getattr(self, key) == getattr(other, key) for key in self.__slots__])
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<{} record>'.format(type(self).__name__)
+
+    def to_primitive(self):
+        """ Return data the record was built from, without unknown keys """
+        data = {}
+        for key in self.__slots__:
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = _to_primitive(value)
+        return data
+
+
+def _to_primitive(value):
+    if isinstance(value, Record):
+        return value.to_primitive()
+    if isinstance(value, tuple):
+        return [_to_primitive(i) for i in value]
+    if isinstance(value, dict):
+        return dict([(k, _to_primitive(v)) for k, v in value.items()])
+    return value
+
+
+class Interner(object):
+    """ Bounded LRU cache of records keyed by hash of their data.
+
+    Equal data gives the same record while it stays in the cache, so
+    loaders keep one record of an organization repeated in many contracts.
+    """
+
+    def __init__(self, size=INTERN_CACHE_SIZE):
+        self.cache = LRUCache(size)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cls, data):
+        key = (cls, md5(json.dumps(data, sort_keys=True)).hexdigest())
+        record = self.cache.get(key)
+        if record is None:
+            self.misses += 1
+            record = cls(data)
+            self.cache.put(key, record)
+        else:
+            self.hits += 1
+        return record
+
+
+class FrozenDict(dict):
+    """ Read-only dict of record values """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('{} is read-only'.format(type(self).__name__))
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+def _freeze(value):
+    if isinstance(value, list):
+        return tuple([_freeze(i) for i in value])
+    if isinstance(value, dict):
+        return FrozenDict([(k, _freeze(v)) for k, v in value.items()])
+    return value
+
+
+def _field_converter(key, field):
+    if isinstance(field, ModelType):
+        cls = record_class(field.model_class)
+    elif isinstance(field, ListType) and isinstance(field.field, ModelType):
+        cls = record_class(field.field.model_class)
+    else:
+        return lambda value, interner: _freeze(value)
+
+    if key in INTERNED_FIELDS:
+        def build(value, interner):
+            return interner.get(cls, value) if interner else cls(value)
+    else:
+        build = cls
+    if isinstance(field, ModelType):
+        return build
+    return lambda value, interner: tuple([build(i, interner) for i in value])
+
+
+def record_class(model_class):
+    """ Return record class for `model_class`, built on first call.
+
+    Record has a slot for each model field, named as the field is stored.
+    Nested models are records too, lists are tuples.
+    """
+    if model_class in _record_classes:
+        return _record_classes[model_class]
+    keys = [(field.serialized_name or name, field) for name, field in model_class._fields.items()
+            if name != '__parent__']
+    cls = type(model_class.__name__, (Record,), {'__slots__': tuple([key for key, field in keys])})
+    # registered before converters are built, so models may refer to themselves
+    _record_classes[model_class] = cls
+    cls._converters = tuple([(key, _field_converter(key, field)) for key, field in keys])
+    return cls
+
+
+def contract_record(data, model=Contract, interner=None):
+    """ Build record of raw contract `data` sharing organizations
+    with other records built with the same `interner`.
+    """
+    return record_class(model)(data, interner)
+
+
+def iter_contract_records(db, page_size=PAGE_SIZE, model=Contract, interner=None, **options):
+    """ Iterate records of all contracts of `db` """
+    cls = record_class(model)
+    interner = interner or Interner()
+    for page in iterview_pages(db, page_size, include_docs=True, **options):
+        for row in page:
+            yield cls(row.doc, interner)
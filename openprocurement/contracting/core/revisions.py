@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+""" Storage of contract revisions out of the contract document.
+
+When archiving is enabled, only the last revisions stay in the contract.
+Older ones are moved in chunks of equal size to `ContractRevisions`
+documents with ids derived from the contract id, and
+`contract.revisionsArchived` counts revisions moved so far. Revisions are
+archived only after the contract is saved with them, and the contract is
+saved once more without them, so chunks hold saved revisions only and a
+chunk written again holds the same ones.
+
+Revisions and historical views have to read the full list of revisions
+with `request.contract_revisions`, archiving can't be enabled until such
+reader is declared with `config.add_contract_revisions_reader`.
+"""
+from couchdb.http import ResourceConflict
+from pyramid.exceptions import ConfigurationError
+
+from openprocurement.api.models import Revision
+
+REVISIONS_DOC_TYPE = 'ContractRevisions'
+REVISIONS_TAIL = 10
+REVISIONS_CHUNK_SIZE = 100
+
+
+def revisions_doc_id(contract_id, number):
+    return '{}-revisions-{:06d}'.format(contract_id, number)
+
+
+def archive_revisions(db, contract, tail=REVISIONS_TAIL):
+    """ Move full chunks of revisions older than last `tail` ones
+    from `contract` to revisions documents.
+
+    Returns number of revisions moved.
+    """
+    archived = contract.revisionsArchived or 0
+    count = (len(contract.revisions) - tail) // REVISIONS_CHUNK_SIZE * REVISIONS_CHUNK_SIZE
+    if count <= 0:
+        return 0
+    for start in xrange(0, count, REVISIONS_CHUNK_SIZE):
+        save_revisions_doc(db, {
+            '_id': revisions_doc_id(contract.id, (archived + start) // REVISIONS_CHUNK_SIZE),
+            'doc_type': REVISIONS_DOC_TYPE,
+            'contract_id': contract.id,
+            'revisions': [i.to_primitive() for i in contract.revisions[start:start + REVISIONS_CHUNK_SIZE]],
+        })
+    contract.revisions = contract.revisions[count:]
+    contract.revisionsArchived = archived + count
+    return count
+
+
+def archive_stored_revisions(db, contract, tail=REVISIONS_TAIL, role=None):
+    """ Archive revisions of `contract` just saved to `db` and save it
+    again without them.
+
+    If that save conflicts, the contract keeps its revisions, the same
+    chunks are written again by its next save. Returns number of revisions
+    moved.
+    """
+    revisions, archived = contract.revisions, contract.revisionsArchived
+    count = archive_revisions(db, contract, tail)
+    if not count:
+        return 0
+    try:
+        contract._id, contract._rev = db.save(contract.to_primitive(role=role))
+    except ResourceConflict:
+        contract.revisions, contract.revisionsArchived = revisions, archived
+        return 0
+    return count
+
+
+def save_revisions_doc(db, doc):
+    """ Save revisions document unless it exists already: chunks are made
+    of saved revisions only, so an existing one holds the same revisions.
+    """
+    try:
+        return db.save(doc)
+    except ResourceConflict:
+        return None
+
+
+def load_revisions(db, contract):
+    """ Return full list of `contract` revisions, archived ones are read
+    with a single request.
+    """
+    archived = contract.revisionsArchived or 0
+    if not archived:
+        return contract.revisions
+    keys = [revisions_doc_id(contract.id, number) for number in xrange(archived // REVISIONS_CHUNK_SIZE)]
+    revisions = []
+    for row in db.view('_all_docs', keys=keys, include_docs=True):
+        if row.get('doc') is None:
+            raise KeyError('Missing revisions document {}'.format(row.key))
+        revisions.extend([Revision(i) for i in row.doc['revisions']])
+    return revisions + contract.revisions
+
+
+def contract_revisions(request):
+    """ Request property with full list of request contract revisions,
+    including archived ones, for revisions and historical views.
+    """
+    return load_revisions(request.registry.db, request.contract)
+
+
+def register_contract_revisions_reader(config, name):
+    """ Declare that view `name` reads contract history with
+    `request.contract_revisions`.
+    :param config:
+        The pyramid configuration object that will be populated.
+    :param name:
+        Name of the view, used in logs only
+    """
+    config.registry.contract_revisions_readers.append(name)
+
+
+def check_revisions_readers(event):
+    """ `ApplicationCreated` subscriber refusing to archive revisions
+    that would be missing in revisions views.
+    """
+    registry = event.app.registry
+    if registry.contract_revisions_tail is not None and not registry.contract_revisions_readers:
+        raise ConfigurationError('contracts.revisions_tail requires revisions views reading '
+                                 'request.contract_revisions, none was added with add_contract_revisions_reader')
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+""" Offline validation of stored contracts.
+
+Streams `contracts/all`, validates contracts with the model of their
+contractType in a pool of worker processes and reports failing contract ids
+grouped by error path::
+
+    contracts_scan http://localhost:5984/openprocurement --workers 8 --output errors.txt \
+        --contract-type esco=openprocurement.contracting.esco.models:Contract
+"""
+import argparse
+import json
+import logging
+from collections import Counter
+from functools import partial
+from importlib import import_module
+from multiprocessing import Pool, cpu_count
+from threading import Event, Semaphore
+
+from couchdb import Database
+from schematics.exceptions import ModelConversionError, ModelValidationError
+
+from openprocurement.contracting.core.utils import iterview_pages
+from openprocurement.contracting.core.models import Contract
+
+LOGGER = logging.getLogger(__name__)
+PAGE_SIZE = 2 ** 8
+SAMPLE_SIZE = 10
+ERROR_PATH = '__error__'
+
+
+def error_paths(messages, path=''):
+    """ Flatten schematics error `messages` into (path, message) pairs.
+
+    List items are shown as `*` in paths, so errors of different items of
+    the same field share one path.
+    """
+    if isinstance(messages, dict):
+        errors = []
+        for key, value in sorted(messages.items()):
+            key = '*' if isinstance(key, int) else key
+            errors.extend(error_paths(value, '{}.{}'.format(path, key) if path else key))
+        return errors
+    if isinstance(messages, (list, tuple)):
+        errors = []
+        for message in messages:
+            if isinstance(message, dict):
+                errors.extend(error_paths(message, '{}.*'.format(path) if path else '*'))
+            else:
+                errors.extend(error_paths(message, path))
+        return errors
+    return [(path, unicode(messages))]
+
+
+def validate_contracts(docs, contract_types=None):
+    """ Validate raw contract `docs`.
+
+    Each contract is validated with the model registered for its
+    contractType in `contract_types` (like `registry.contract_contractTypes`),
+    or with core `Contract` when no types are given.
+
+    Returns number of validated documents and list of
+    (contract id, path, message) for each error found.
+    """
+    errors = []
+    for doc in docs:
+        if contract_types is None:
+            model = Contract
+        else:
+            model = contract_types.get(doc.get('contractType', 'common'))
+            if model is None:
+                errors.append((doc['_id'], 'contractType', u'Not implemented'))
+                continue
+        try:
+            model(doc).validate()
+        except (ModelConversionError, ModelValidationError) as e:
+            errors.extend([(doc['_id'], path, message) for path, message in error_paths(e.messages)])
+        except Exception as e:
+            errors.append((doc['_id'], ERROR_PATH, u'{}: {}'.format(type(e).__name__, e)))
+    return len(docs), errors
+
+
+class ScanReport(object):
+    """ Validation errors grouped by path.
+
+    Keeps number of failing contracts, distinct messages and a sample of
+    contract ids for each path, so memory does not depend on number of
+    failures.
+    """
+
+    def __init__(self, output=None, sample_size=SAMPLE_SIZE):
+        self.output = output
+        self.sample_size = sample_size
+        self.scanned = 0
+        self.failed = 0
+        self.paths = {}
+
+    def add(self, scanned, errors):
+        """ Add `errors` found in a batch of `scanned` contracts """
+        self.scanned += scanned
+        self.failed += len(set([i[0] for i in errors]))
+        seen = set()
+        for contract_id, path, message in errors:
+            group = self.paths.setdefault(path, {'count': 0, 'messages': Counter(), 'ids': []})
+            group['messages'][message] += 1
+            if (contract_id, path) not in seen:
+                seen.add((contract_id, path))
+                group['count'] += 1
+                if len(group['ids']) < self.sample_size:
+                    group['ids'].append(contract_id)
+            if self.output:
+                self.output.write(u'{}\t{}\t{}\n'.format(contract_id, path, message).encode('utf-8'))
+
+    def as_dict(self):
+        return {
+            'scanned': self.scanned,
+            'failed': self.failed,
+            'paths': dict([(path, {
+                'count': group['count'],
+                'messages': dict(group['messages']),
+                'ids': group['ids'],
+            }) for path, group in self.paths.items()]),
+        }
+
+
+def _bounded(iterable, semaphore, stopped):
+    for item in iterable:
+        semaphore.acquire()
+        if stopped.is_set():
+            return
+        yield item
+
+
+def scan_contracts(db, workers=1, report=None, page_size=PAGE_SIZE, contract_types=None, **options):
+    """ Validate all contracts of `db` with `workers` processes.
+
+    At most two pages per worker are read ahead, so memory stays bounded
+    on any database size.
+    """
+    report = report or ScanReport()
+    pages = ([i.doc for i in page] for page in iterview_pages(db, page_size, include_docs=True, **options))
+    validate = partial(validate_contracts, contract_types=contract_types)
+    if workers <= 1:
+        for docs in pages:
+            report.add(*validate(docs))
+        return report
+    semaphore = Semaphore(workers * 2)
+    stopped = Event()
+    pool = Pool(workers)
+    try:
+        for scanned, errors in pool.imap_unordered(validate, _bounded(pages, semaphore, stopped)):
+            semaphore.release()
+            report.add(scanned, errors)
+            LOGGER.debug("{} contracts scanned, {} failed.".format(report.scanned, report.failed))
+        pool.close()
+    except:
+        # pool task feeder may wait for the semaphore, terminate would wait for it forever
+        stopped.set()
+        semaphore.release()
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return report
+
+
+def load_contract_types(values):
+    """ Build contractType mapping from `name=module:Model` strings """
+    contract_types = {}
+    for value in values:
+        name, path = value.split('=', 1)
+        module, attr = path.split(':', 1)
+        contract_types[name] = getattr(import_module(module), attr)
+    return contract_types
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate stored contracts.')
+    parser.add_argument('db', help='database url, e.g. http://localhost:5984/openprocurement')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, all cores by default')
+    parser.add_argument('--output', help='file to write every error to')
+    parser.add_argument('--report', help='file to write JSON report to, stdout by default')
+    parser.add_argument('--contract-type', action='append', default=[], metavar='NAME=MODULE:MODEL',
+                        help='model of contractType, core Contract for all contracts if none given')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    contract_types = load_contract_types(args.contract_type) if args.contract_type else None
+
+    output = open(args.output, 'w') if args.output else None
+    try:
+        report = scan_contracts(Database(args.db), args.workers or cpu_count(), ScanReport(output),
+                                contract_types=contract_types)
+    finally:
+        if output:
+            output.close()
+    data = json.dumps(report.as_dict(), indent=2, sort_keys=True)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(data)
+    else:
+        print data
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import unittest
+from uuid import uuid4
+
+from mock import patch
+
+from openprocurement.contracting.core.tests.base import BaseContractContentWebTest
+
+
+class ContractBatchTest(BaseContractContentWebTest):
+
+    def setUp(self):
+        super(ContractBatchTest, self).setUp()
+        self.app.app.registry.docservice_url = 'http://localhost'
+        patcher = patch('openprocurement.contracting.core.batch.check_document')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = '/contracts/{}/batch?acc_token={}'.format(self.contract_id, self.contract_token)
+
+    def document(self, **kwargs):
+        data = {
+            'title': u'укр.doc',
+            'url': 'http://localhost/get/{}?Signature=x&KeyID=y'.format(uuid4().hex),
+            'hash': 'md5:' + '0' * 32,
+            'format': 'application/msword',
+        }
+        data.update(kwargs)
+        return {'type': 'document', 'data': data}
+
+    def change(self):
+        return {'type': 'change', 'data': {'rationale': u'причина', 'rationaleTypes': ['qualityImprovement']}}
+
+    def test_batch(self):
+        revisions = len(self.db.get(self.contract_id)['revisions'])
+        response = self.app.post_json(self.url, {'data': [
+            self.change(),
+            self.document(documentOf='change'),
+            self.document(),
+        ]})
+        self.assertEqual(response.status, '201 Created')
+        change, change_document, document = response.json['data']
+        self.assertEqual(change['status'], 'pending')
+        self.assertEqual(change_document['relatedItem'], change['id'])
+        self.assertEqual(document['documentOf'], 'contract')
+
+        contract = self.db.get(self.contract_id)
+        self.assertEqual(len(contract['revisions']), revisions + 1)
+        self.assertEqual([i['id'] for i in contract['changes']], [change['id']])
+        self.assertEqual([i['id'] for i in contract['documents']], [change_document['id'], document['id']])
+
+        response = self.app.get('/contracts/{}/documents/{}'.format(self.contract_id, document['id']))
+        self.assertEqual(response.json['data']['title'], u'укр.doc')
+
+    def test_atomic(self):
+        rev = self.db.get(self.contract_id)['_rev']
+        response = self.app.post_json(self.url, {'data': [self.change(), self.document(), self.change()]},
+                                      status=403)
+        self.assertEqual(response.json['errors'][0]['description'],
+                         "Can't create new contract change while any (pending) change exists")
+
+        response = self.app.post_json(self.url, {'data': [
+            self.document(), self.document(documentOf='change', relatedItem=uuid4().hex)]}, status=422)
+        self.assertEqual(response.json['errors'][0]['name'], 'data.1.relatedItem')
+        self.assertEqual(self.db.get(self.contract_id)['_rev'], rev)
+
+    def test_change_document_without_change(self):
+        response = self.app.post_json(self.url, {'data': [self.document(), self.document(documentOf='change')]},
+                                      status=422)
+        self.assertEqual(response.json['errors'], [
+            {u'description': [u'This field is required.'], u'location': u'body', u'name': u'data.1.relatedItem'}])
+
+    def test_operation_error_name(self):
+        self.app.post_json(self.url, {'data': [self.change()]})
+        response = self.app.post_json(self.url, {'data': [self.document(), self.change()]}, status=403)
+        self.assertEqual(response.json['errors'][0]['name'], 'data.1')
+
+    def test_invalid_data(self):
+        self.app.post_json(self.url, {'data': {}}, status=422)
+        response = self.app.post_json(self.url, {'data': [{'type': 'item', 'data': {}}]}, status=422)
+        self.assertEqual(response.json['errors'][0]['name'], 'data.0.type')
+        self.app.app.registry.docservice_url = None
+        self.app.post_json(self.url, {'data': [self.document()]}, status=403)
+
+    def test_forbidden(self):
+        self.app.post_json('/contracts/{}/batch'.format(self.contract_id), {'data': [self.change()]}, status=403)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ContractBatchTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
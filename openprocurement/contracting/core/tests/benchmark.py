@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+""" Migration steps benchmark on in-memory database.
+
+Run as::
+
+    python -m openprocurement.contracting.core.tests.benchmark -n 10000 -n 100000
+
+Every size is run in a separate process, so peak RSS of one size does
+not include others. Steps of one size share the process: `peak_rss` is
+the peak of the process so far (including generated data) and
+`peak_rss_delta` is how much the step raised it.
+"""
+import argparse
+import resource
+from copy import deepcopy
+from multiprocessing import Pool
+from time import time
+from uuid import uuid4
+
+from libnacl.sign import Signer
+
+from openprocurement.api.utils import get_now
+from openprocurement.contracting.core import migration
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.tests.fakedb import FakeRegistry
+
+
+def generate_data(db, count, contracts_per_tender=2):
+    """ Save `count` contracts at schema version 0 with their tenders """
+    docs = []
+    for i in xrange(count):
+        if i % contracts_per_tender == 0:
+            tender_id, award_id = uuid4().hex, uuid4().hex
+            docs.append({
+                '_id': tender_id,
+                'doc_type': 'Tender',
+                'awards': [{
+                    'id': award_id,
+                    'suppliers': test_contract_data['suppliers'],
+                    'value': test_contract_data['value'],
+                }],
+            })
+        contract = deepcopy(test_contract_data)
+        del contract['suppliers']
+        del contract['value']
+        contract_id = uuid4().hex
+        contract.update({
+            '_id': contract_id,
+            'id': contract_id,
+            'doc_type': 'Contract',
+            'contractID': 'UA-{:09d}'.format(i),
+            'tender_id': tender_id,
+            'awardID': award_id,
+            'dateModified': get_now().isoformat(),
+            'documents': [{
+                'id': uuid4().hex,
+                'title': 'name.txt',
+                'url': '/tenders/{}/documents/{}?download={}'.format(tender_id, uuid4().hex, uuid4().hex),
+                'datePublished': get_now().isoformat(),
+                'dateModified': get_now().isoformat(),
+                'format': 'text/plain',
+            }],
+        })
+        docs.append(contract)
+        if len(docs) >= 2 ** 10:
+            db.update(docs)
+            docs = []
+    if docs:
+        db.update(docs)
+
+
+def run_benchmark(count, settings=None):
+    """ Run migration steps over `count` contracts and collect their metrics """
+    registry = FakeRegistry(settings=settings, docservice_url='http://localhost',
+                            docservice_key=Signer('\0' * 32))
+    db = registry.db
+    generate_data(db, count)
+    migration.set_db_schema_version(db, 0)
+    results = []
+    for step in xrange(migration.SCHEMA_VERSION):
+        migration_func = getattr(migration, 'from{}to{}'.format(step, step + 1))
+        db.requests.clear()
+        db.sent = db.received = 0
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time()
+        stats = migration.run_migration_step(registry, migration_func)
+        seconds = time() - start
+        migration.set_db_schema_version(db, step + 1)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results.append({
+            'step': migration_func.__name__,
+            'contracts': count,
+            'updated': stats['updated'],
+            'seconds': seconds,
+            'docs_per_second': stats['scanned'] / seconds if seconds else 0,
+            'peak_rss': peak_rss,
+            'peak_rss_delta': peak_rss - rss,
+            'requests': dict(db.requests),
+            'sent': db.sent,
+            'received': db.received,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark contracts migration steps.')
+    parser.add_argument('-n', '--contracts', type=int, action='append',
+                        help='number of contracts (can be repeated), 10000 by default')
+    parser.add_argument('--from1to2', choices=['model', 'dict'], default='model',
+                        help='from1to2 migration mode')
+    args = parser.parse_args()
+    settings = {'migration.from1to2': args.from1to2}
+    for count in args.contracts or [10 ** 4]:
+        pool = Pool(1)
+        try:
+            results = pool.apply(run_benchmark, (count, settings))
+        finally:
+            pool.terminate()
+        for result in results:
+            print ("{step} {contracts:>8} contracts: {updated} updated in {seconds:.1f}s "
+                   "({docs_per_second:.0f} docs/s), peak RSS {peak_rss} KB (+{peak_rss_delta} KB), "
+                   "{sent} bytes sent, {received} bytes received, requests {requests}".format(**result))
+
+
+if __name__ == '__main__':
+    main()
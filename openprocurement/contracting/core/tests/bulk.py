@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from copy import deepcopy
+from uuid import uuid4
+
+from mock import patch
+from schematics.exceptions import ModelValidationError
+
+from openprocurement.contracting.core.tests.base import (
+    documents,
+    test_contract_data,
+    BaseWebTest
+)
+
+
+class ContractsBulkTest(BaseWebTest):
+
+    def setUp(self):
+        super(ContractsBulkTest, self).setUp()
+        self.app.authorization = ('Basic', ('contracting', ''))
+
+    def contract_data(self, **kwargs):
+        data = deepcopy(test_contract_data)
+        data.update(id=uuid4().hex, **kwargs)
+        return data
+
+    def test_create(self):
+        items = [self.contract_data(contractID='UA-{}'.format(i)) for i in xrange(3)]
+        items[1]['documents'] = deepcopy(documents)
+        with patch.object(self.db, 'save') as save:
+            response = self.app.post_json('/contracts_bulk', {'data': items})
+        self.assertFalse(save.called)
+        self.assertEqual(response.status, '200 OK')
+        results = response.json['data']
+        self.assertEqual([i['status'] for i in results], [201, 201, 201])
+        self.assertEqual([i['data']['contractID'] for i in results], ['UA-0', 'UA-1', 'UA-2'])
+        self.assertEqual(len(results[1]['data']['documents']), 2)
+
+        for item, result in zip(items, results):
+            doc = self.db.get(item['id'])
+            self.assertEqual(doc['owner_token'], result['access']['token'])
+            self.assertEqual(len(doc['revisions']), 1)
+            self.assertIn('dateModified', doc)
+
+        response = self.app.patch_json('/contracts/{}?acc_token={}'.format(
+            items[0]['id'], results[0]['access']['token']), {'data': {'title': 'changed'}})
+        self.assertEqual(response.json['data']['title'], 'changed')
+
+    def stored(self, contract_id, token):
+        """ Stored document with id, credentials and dates replaced """
+        doc = self.db.get(contract_id)
+        del doc['_rev'], doc['dateModified']
+        for revision in doc['revisions']:
+            del revision['date']
+        return json.dumps(doc, sort_keys=True).replace(contract_id, 'id').replace(token, 'token')
+
+    def test_same_as_single(self):
+        data = self.contract_data(documents=deepcopy(documents))
+        response = self.app.post_json('/contracts', {'data': data})
+        single = self.stored(data['id'], response.json['access']['token'])
+
+        data['id'] = uuid4().hex
+        result = self.app.post_json('/contracts_bulk', {'data': [data]}).json['data'][0]
+        self.assertEqual(self.stored(data['id'], result['access']['token']), single)
+
+    def test_item_errors(self):
+        existing = self.contract_data()
+        self.app.post_json('/contracts_bulk', {'data': [existing]})
+        invalid = self.contract_data()
+        del invalid['procuringEntity']
+        duplicate = self.contract_data()
+        items = [
+            invalid,
+            self.contract_data(contractType='unknown'),
+            existing,
+            duplicate,
+            duplicate,
+            'contract',
+        ]
+        response = self.app.post_json('/contracts_bulk', {'data': items})
+        results = response.json['data']
+        self.assertEqual([i['status'] for i in results], [422, 415, 409, 201, 409, 422])
+        self.assertEqual(results[0]['errors'], [
+            {u'description': [u'This field is required.'], u'location': u'body', u'name': u'procuringEntity'}])
+        self.assertNotIn(invalid['id'], self.db)
+
+    def test_batches(self):
+        items = [self.contract_data() for i in xrange(5)]
+        update = self.db.update
+        with patch.object(self.db, 'update', side_effect=update) as bulk_update:
+            with patch('openprocurement.contracting.core.bulk.BULK_BATCH_SIZE', 2):
+                response = self.app.post_json('/contracts_bulk', {'data': items})
+        self.assertEqual([i['status'] for i in response.json['data']], [201] * 5)
+        self.assertEqual(bulk_update.call_count, 3)
+
+    def test_prepared_before_write(self):
+        items = [self.contract_data() for i in xrange(5)]
+        model = self.app.app.registry.contract_contractTypes['common']
+        to_store = model.to_store
+
+        def failing_to_store(contract, db, *args, **kwargs):
+            if contract.id == items[3]['id']:
+                raise ModelValidationError({'items': [u'Failed to store.']})
+            return to_store(contract, db, *args, **kwargs)
+
+        with patch.object(model, 'to_store', failing_to_store):
+            with patch('openprocurement.contracting.core.bulk.BULK_BATCH_SIZE', 2):
+                response = self.app.post_json('/contracts_bulk', {'data': items})
+        results = response.json['data']
+        self.assertEqual([i['status'] for i in results], [201, 201, 201, 422, 201])
+        self.assertEqual(results[3]['errors'], [
+            {u'description': [u'Failed to store.'], u'location': u'body', u'name': u'items'}])
+        self.assertNotIn(items[3]['id'], self.db)
+
+    def test_value_error(self):
+        model = self.app.app.registry.contract_contractTypes['common']
+        with patch.object(model, 'validate', side_effect=ValueError('Invalid value')):
+            response = self.app.post_json('/contracts_bulk', {'data': [self.contract_data()]})
+        self.assertEqual(response.json['data'], [{u'status': 422, u'errors': [
+            {u'description': u'Invalid value', u'location': u'body', u'name': u'data'}]}])
+
+    def test_invalid_data(self):
+        response = self.app.post_json('/contracts_bulk', {'data': {}}, status=422)
+        self.assertEqual(response.json['errors'], [
+            {u'description': u'Data not available', u'location': u'body', u'name': u'data'}])
+        with patch('openprocurement.contracting.core.validation.BULK_MAX_SIZE', 1):
+            self.app.post_json('/contracts_bulk', {'data': [{}, {}]}, status=422)
+
+    def test_forbidden(self):
+        self.app.authorization = ('Basic', ('broker', ''))
+        self.app.post_json('/contracts_bulk', {'data': [self.contract_data()]}, status=403)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ContractsBulkTest))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+import unittest
+from copy import deepcopy
+
+from mock import MagicMock, patch
+
+from openprocurement.contracting.core.cache import (
+    CachedDatabase,
+    ChangesListener,
+    ContractCache,
+    SerializeCache,
+)
+from openprocurement.contracting.core.models import Contract
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.tests.fakedb import FakeDatabase
+
+
+class TestSerializeCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = SerializeCache(budget=25)
+        cache.put('a', {'x': 'a'})
+        cache.put('b', {'x': 'b'})
+        self.assertEqual(cache.get('a'), {'x': 'a'})
+        cache.put('c', {'x': 'c'})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'x': 'a'})
+        self.assertEqual(cache.get('c'), {'x': 'c'})
+        self.assertEqual(cache.status(), {'entries': 2, 'size': 20, 'budget': 25, 'hits': 3, 'misses': 1})
+
+    def test_too_large(self):
+        cache = SerializeCache(budget=5)
+        cache.put('a', {'x': 'a'})
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('a'))
+
+    def test_replace(self):
+        cache = SerializeCache(budget=100)
+        cache.put('a', {'x': 'a'})
+        cache.put('a', {'x': 'abc'})
+        self.assertEqual(cache.size, 12)
+        self.assertEqual(cache.get('a'), {'x': 'abc'})
+
+    def test_get_returns_copy(self):
+        cache = SerializeCache(budget=100)
+        cache.put('a', {'x': {'y': [1]}})
+        cache.get('a')['x']['y'].append(2)
+        self.assertEqual(cache.get('a'), {'x': {'y': [1]}})
+
+
+class TestContractSerializeCache(unittest.TestCase):
+
+    def setUp(self):
+        data = deepcopy(test_contract_data)
+        data['_rev'] = '1-a'
+        self.contract = Contract(data)
+        self.cache = SerializeCache(budget=2 ** 20)
+        self.contract.__parent__ = MagicMock()
+        self.contract.__parent__.request.method = 'GET'
+        self.contract.__parent__.request.registry.contract_serialize_cache = self.cache
+
+    def test_cached_by_rev(self):
+        data = self.contract.serialize('view')
+        self.assertEqual(self.contract.serialize('view'), data)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.contract.status = 'terminated'
+        self.contract._rev = '2-b'
+        self.assertEqual(self.contract.serialize('view')['status'], 'terminated')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_changing_request(self):
+        self.contract.serialize('view')
+        self.contract.__parent__.request.method = 'PATCH'
+        self.contract.status = 'terminated'
+        self.assertEqual(self.contract.serialize('view')['status'], 'terminated')
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_not_cached(self):
+        self.contract.serialize('plain')
+        self.contract.serialize('view', fields=['status'])
+        Contract(deepcopy(test_contract_data)).serialize('view')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_not_configured(self):
+        data = deepcopy(test_contract_data)
+        data['_rev'] = '1-a'
+        Contract(data).serialize('view')
+        self.contract.__parent__.request.registry.contract_serialize_cache = None
+        self.contract.serialize('view')
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_copy_returned(self):
+        self.contract.serialize('view')['status'] = 'terminated'
+        self.assertEqual(self.contract.serialize('view')['status'], 'active')
+
+    def test_nested_copy_returned(self):
+        data = self.contract.serialize('view')
+        data['items'][0]['quantity'] = 100
+        data['suppliers'][0]['contactPoint']['name'] = u'Інший'
+        self.contract.serialize('view')['value']['amount'] = 0
+        data = self.contract.serialize('view')
+        self.assertEqual(data, self.contract.serialize('view'))
+        self.assertEqual(data['items'][0]['quantity'], test_contract_data['items'][0]['quantity'])
+        self.assertEqual(data['suppliers'][0]['contactPoint']['name'],
+                         test_contract_data['suppliers'][0]['contactPoint']['name'])
+        self.assertEqual(data['value']['amount'], test_contract_data['value']['amount'])
+
+
+class TestContractCache(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(ContractCache, 'listen')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ContractCache(size=2)
+        self.db = CachedDatabase(FakeDatabase(), self.cache)
+        data = deepcopy(test_contract_data)
+        data['_id'] = data.pop('id')
+        data['doc_type'] = 'Contract'
+        self.db.save(data)
+        self.contract_id = data['_id']
+
+    def test_cached(self):
+        doc = self.db.get(self.contract_id)
+        doc['status'] = 'terminated'
+        self.assertEqual(self.db.get(self.contract_id)['status'], 'active')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertIsNone(self.db.get('missing'))
+        self.assertEqual(self.db.get(self.contract_id, revs=True)['_id'], self.contract_id)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_only_contracts(self):
+        self.db.save({'_id': 'other', 'doc_type': 'ContractRevisions'})
+        self.db.get('other')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_saved(self):
+        doc = self.db.get(self.contract_id)
+        doc['status'] = 'terminated'
+        self.db.save(doc)
+        self.assertEqual(self.db.get(self.contract_id)['status'], 'terminated')
+        doc = self.db.get(self.contract_id)
+        doc['status'] = 'active'
+        self.db.update([doc])
+        self.assertEqual(self.db.get(self.contract_id)['status'], 'active')
+
+    def test_ttl(self):
+        self.db.get(self.contract_id)
+        with patch('openprocurement.contracting.core.cache.time', return_value=10 ** 10):
+            self.db.get(self.contract_id)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_changed_while_read(self):
+        generation = self.cache.generation
+        doc = self.db.db.get(self.contract_id)
+        self.cache.invalidate(self.contract_id)
+        self.cache.put(self.contract_id, doc, generation)
+        self.assertEqual(len(self.cache), 0)
+        self.cache.put(self.contract_id, doc, self.cache.generation)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_lru(self):
+        for i in xrange(3):
+            self.db.save({'_id': str(i), 'doc_type': 'Contract'})
+            self.db.get(str(i))
+        self.assertEqual(list(self.cache._entries), ['1', '2'])
+
+
+class TestChangesListener(unittest.TestCase):
+
+    def test_invalidate(self):
+        cache = ContractCache()
+        cache.put('a', {'_id': 'a'}, 0)
+        cache.put('b', {'_id': 'b'}, 0)
+        db = MagicMock()
+        db.changes.return_value = iter([{'seq': 5, 'id': 'a'}, {'last_seq': 6}])
+        listener = ChangesListener(db, cache)
+        listener.follow()
+        self.assertEqual(list(cache._entries), ['b'])
+        self.assertEqual(listener.since, 6)
+        db.changes.assert_called_once_with(feed='continuous', since='now', heartbeat=10000)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestSerializeCache))
+    suite.addTest(unittest.makeSuite(TestContractSerializeCache))
+    suite.addTest(unittest.makeSuite(TestContractCache))
+    suite.addTest(unittest.makeSuite(TestChangesListener))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from copy import deepcopy
+from hashlib import md5
+from itertools import islice
+from threading import RLock
+from uuid import uuid4
+
+from couchdb import json
+from couchdb.client import Document, Row
+from couchdb.http import ResourceConflict, ResourceNotFound
+
+
+def contracts_all(doc):
+    if doc.get('doc_type') == 'Contract':
+        yield doc.get('contractID'), None
+
+
+VIEWS = {
+    'contracts/all': contracts_all,
+}
+
+
+class ViewResults(list):
+    """ Rows of the view with `total_rows` and `offset` like in couchdb """
+
+    def __init__(self, rows, total_rows, offset):
+        super(ViewResults, self).__init__(rows)
+        self.total_rows = total_rows
+        self.offset = offset
+
+    @property
+    def rows(self):
+        return self
+
+
+class ViewIndex(object):
+    """ Sorted rows of a view, updated with documents changed since the
+    last refresh.
+    """
+
+    def __init__(self, map_func):
+        self.map_func = map_func
+        self.rows = []
+        self.keys = []
+        self.emitted = {}
+        self.pending = {}
+
+    def refresh(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        if len(pending) > max(len(self.rows) // 10, 2 ** 10):
+            # cheaper to sort everything again
+            rows = [row for row in self.rows if row[1] not in pending]
+            for doc_id, data in pending.items():
+                rows.extend(self.map(doc_id, data))
+            self.rows = sorted(rows, key=lambda row: row[:2])
+            self.keys = [row[0] for row in self.rows]
+            return
+        for doc_id, data in pending.items():
+            for row in self.emitted.pop(doc_id, []):
+                index = bisect_left(self.rows, row[:2])
+                del self.rows[index]
+                del self.keys[index]
+            for row in self.map(doc_id, data):
+                index = bisect_left(self.rows, row[:2])
+                self.rows.insert(index, row)
+                self.keys.insert(index, row[0])
+
+    def map(self, doc_id, data):
+        rows = []
+        if data is not None:
+            rows = [(key, doc_id, value) for key, value in self.map_func(json.decode(data))]
+        self.emitted[doc_id] = rows
+        return rows
+
+    def slice(self, startkey=None, startkey_docid=None, endkey=None, inclusive_end=True):
+        start, end = 0, len(self.rows)
+        if startkey is not None and startkey_docid is not None:
+            start = bisect_left(self.rows, (startkey, startkey_docid))
+        elif startkey is not None:
+            start = bisect_left(self.keys, startkey)
+        if endkey is not None:
+            end = bisect_right(self.keys, endkey) if inclusive_end else bisect_left(self.keys, endkey)
+        return start, max(start, end)
+
+
+class FakeDatabase(object):
+    """ In-memory stand-in for `couchdb.Database` used by migrations.
+
+    Supports `get`, `save`, `update`, `view` and `iterview` with key ranges,
+    paging, multi-key `_all_docs` requests and the `stale` option. Views are
+    python map functions yielding (key, value) pairs, rows are ordered by
+    (key, doc id) with python ordering instead of couchdb collation.
+    Documents are stored JSON encoded, and every method call emulating an
+    HTTP request is counted in `requests`. Calls are serialized with a
+    lock, so the database may be shared with migration writer thread.
+    """
+
+    def __init__(self, name='fake', views=None):
+        self.name = name
+        self.views = dict(VIEWS, **(views or {}))
+        self.requests = Counter()
+        self.sent = 0
+        self.received = 0
+        self._docs = {}
+        self._indexes = {}
+        self._lock = RLock()
+
+    def __contains__(self, id):
+        return id in self._docs
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __delitem__(self, id):
+        with self._lock:
+            self.requests['delete'] += 1
+            if id not in self._docs:
+                raise ResourceNotFound('missing')
+            del self._docs[id]
+            for index in self._indexes.values():
+                index.pending[id] = None
+
+    def _load(self, id):
+        data = self._docs[id]
+        self.received += len(data)
+        return Document(json.decode(data))
+
+    def _store(self, doc):
+        doc = dict(doc)
+        doc_id = doc.setdefault('_id', uuid4().hex)
+        current = self._docs.get(doc_id)
+        current_rev = current and json.decode(current)['_rev']
+        if doc.get('_rev') != current_rev:
+            raise ResourceConflict('Document update conflict.')
+        number = int(current_rev.split('-')[0]) + 1 if current_rev else 1
+        doc.pop('_rev', None)
+        doc['_rev'] = '{}-{}'.format(number, md5(json.encode(doc)).hexdigest())
+        data = json.encode(doc)
+        self.sent += len(data)
+        self._docs[doc_id] = data
+        for index in self._indexes.values():
+            index.pending[doc_id] = data
+        return doc_id, doc['_rev']
+
+    def get(self, id, default=None, **options):
+        with self._lock:
+            self.requests['get'] += 1
+            if id not in self._docs:
+                return default
+            return self._load(id)
+
+    def save(self, doc, **options):
+        with self._lock:
+            self.requests['save'] += 1
+            doc_id, rev = self._store(doc)
+        doc.update({'_id': doc_id, '_rev': rev})
+        return doc_id, rev
+
+    def update(self, documents, **options):
+        with self._lock:
+            self.requests['update'] += 1
+            results = []
+            for doc in documents:
+                try:
+                    results.append((True,) + self._store(doc))
+                except ResourceConflict as e:
+                    results.append((False, doc.get('_id'), e))
+        return results
+
+    def _all_docs(self, keys):
+        rows = []
+        for key in keys:
+            if key in self._docs:
+                rows.append(Row(id=key, key=key, value={'rev': json.decode(self._docs[key])['_rev']}))
+            else:
+                rows.append(Row(key=key, error='not_found'))
+        return rows
+
+    def view(self, name, wrapper=None, **options):
+        with self._lock:
+            return self._view(name, wrapper, **options)
+
+    def _view(self, name, wrapper=None, **options):
+        self.requests['view'] += 1
+        include_docs = options.pop('include_docs', False)
+        limit = options.pop('limit', None)
+        skip = options.pop('skip', 0)
+        stale = options.pop('stale', None)
+        if name == '_all_docs' and 'keys' in options:
+            rows = self._all_docs(options.pop('keys'))
+            total, offset = len(self._docs), 0
+            rows = rows[skip:None if limit is None else skip + limit]
+        else:
+            index = self._indexes.get(name)
+            if index is None:
+                index = self._indexes[name] = ViewIndex(self.views[name])
+                index.pending.update(self._docs)
+            if stale not in ('ok', 'update_after'):
+                index.refresh()
+            start, end = index.slice(**dict([(i, options.pop(i)) for i in (
+                'startkey', 'startkey_docid', 'endkey', 'inclusive_end') if i in options]))
+            offset = start + skip
+            end = end if limit is None else min(end, offset + limit)
+            total = len(index.rows)
+            rows = [Row(id=doc_id, key=key, value=deepcopy(value))
+                    for key, doc_id, value in index.rows[offset:end]]
+            if stale == 'update_after':
+                index.refresh()
+        if options:
+            raise TypeError('Unsupported view options: {}'.format(', '.join(options)))
+        if include_docs:
+            for row in rows:
+                if row.id in self._docs:
+                    row['doc'] = self._load(row.id)
+        if wrapper:
+            rows = [wrapper(row) for row in rows]
+        return ViewResults(rows, total, offset)
+
+    def iterview(self, name, batch, wrapper=None, **options):
+        """ Iterate view rows fetching them in batches like couchdb does,
+        at most `limit` rows if given.
+        """
+        limit = options.pop('limit', None)
+        while limit is None or limit > 0:
+            size = batch if limit is None else min(batch, limit)
+            options['limit'] = size + 1
+            rows = self.view(name, wrapper, **dict(options))
+            for row in islice(rows, size):
+                yield row
+            if limit is not None:
+                limit -= size
+            if len(rows) <= size:
+                break
+            options.update(startkey=rows[-1]['key'], startkey_docid=rows[-1]['id'])
+
+
+class FakeRegistry(object):
+    """ Registry stand-in with what migrations need from it """
+
+    def __init__(self, db=None, settings=None, docservice_url=None, docservice_key=None):
+        self.db = db if db is not None else FakeDatabase()
+        self.settings = settings or {}
+        self.docservice_url = docservice_url
+        self.docservice_key = docservice_key
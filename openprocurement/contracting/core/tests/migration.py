@@ -4,6 +4,13 @@ import json
 import unittest
 
 from copy import deepcopy
+from uuid import uuid4
+from libnacl.sign import Signer
+from mock import MagicMock, patch
+from repoze.lru import ExpiringLRUCache, LRUCache
+from time import time
+from couchdb.http import ResourceConflict
+from pyramid.exceptions import ConfigurationError
 from openprocurement.tender.belowthreshold.models import Tender
 from openprocurement.api.utils import get_now
 from openprocurement.contracting.core.models import Contract
@@ -11,12 +18,33 @@ from openprocurement.contracting.core.migration import (
     migrate_data,
     get_db_schema_version,
     set_db_schema_version,
-    SCHEMA_VERSION
+    get_key_ranges,
+    get_tenders_awards,
+    get_contracts_schema_version,
+    BulkWriter,
+    check_from1to2,
+    diff_paths,
+    upgrade_contract,
+    run_migration_step,
+    from0to1,
+    Throttle,
+    MAX_SLOWDOWN,
+    MIN_WRITE_BATCH,
+    get_checkpoint,
+    set_checkpoint,
+    SCHEMA_CHECK_INTERVAL,
+    SCHEMA_DOC,
+    SCHEMA_VERSION,
+    Request
 )
+from openprocurement.contracting.api.traversal import Root
 from openprocurement.contracting.core.tests.base import (
+    documents,
     test_contract_data,
     BaseWebTest
 )
+from openprocurement.contracting.core.tests.benchmark import generate_data
+from openprocurement.contracting.core.tests.fakedb import FakeRegistry
 
 
 class MigrateTest(BaseWebTest):
@@ -88,14 +116,468 @@ class MigrateTest(BaseWebTest):
         self.assertIn('KeyID=', migrated_item['documents'][0]['url'])
         self.assertIn('Signature=', migrated_item['documents'][0]['url'])
 
+    def test_migrate_from1to2_dict_mode(self):
+        set_db_schema_version(self.db, 1)
+        u = Contract(test_contract_data)
+        u.contractID = "UA-X"
+        u.store(self.db)
+        tender_id = uuid4().hex
+        data = self.db.get(u.id)
+        data["documents"] = [
+            {
+                "id": "ebcb5dd7f7384b0fbfbed2dc4252fa6e",
+                "title": "name.txt",
+                "url": "/tenders/{}/documents/ebcb5dd7f7384b0fbfbed2dc4252fa6e?download=10367238a2964ee18513f209d9b6d1d3".format(tender_id),
+                "datePublished": "2016-06-01T00:00:00+03:00",
+                "dateModified": "2016-06-01T00:00:00+03:00",
+                "format": "text/plain",
+            },
+            {
+                "id": "0c3a4f0bbd2b4c8e9e5e1d1ae4c6a7b2",
+                "title": "signed.txt",
+                "url": "/tenders/{}/documents/0c3a4f0bbd2b4c8e9e5e1d1ae4c6a7b2?download=5e2c1d6bbf0a4d3c9f7a8b6e4d2c1a0f".format(tender_id),
+                "hash": "md5:" + "0" * 32,
+                "datePublished": "2016-06-01T00:00:00+03:00",
+                "dateModified": "2016-06-01T00:00:00+03:00",
+                "format": "text/plain",
+            }
+        ]
+        self.db.save(data)
+        registry = self.app.app.registry
+        registry.docservice_url = 'http://localhost'
+        mismatches = check_from1to2(registry)
+        self.assertEqual([path for _, path in mismatches if path.startswith('/documents')], [])
+
+        registry.settings['migration.from1to2'] = 'dict'
+        try:
+            migrate_data(registry, 2)
+        finally:
+            del registry.settings['migration.from1to2']
+        migrated_item = self.db.get(u.id)
+        url = migrated_item['documents'][0]['url']
+        self.assertIn('http://localhost/get/10367238a2964ee18513f209d9b6d1d3?', url)
+        self.assertIn('Prefix={}%2Febcb5dd7f7384b0fbfbed2dc4252fa6e'.format(tender_id), url)
+        self.assertIn('KeyID=', url)
+        self.assertIn('Signature=', url)
+        self.assertEqual(migrated_item['documents'][0]['title'], "name.txt")
+        url = migrated_item['documents'][1]['url']
+        self.assertIn('http://localhost/get/5e2c1d6bbf0a4d3c9f7a8b6e4d2c1a0f?', url)
+        self.assertNotIn('Prefix=', url)
+        self.assertIn('Signature=', url)
+
+    def test_migrate_from1to2_dry_run(self):
+        set_db_schema_version(self.db, 1)
+        u = Contract(test_contract_data)
+        u.contractID = "UA-X"
+        u.store(self.db)
+        data = self.db.get(u.id)
+        data["documents"] = [
+            {
+                "id": "ebcb5dd7f7384b0fbfbed2dc4252fa6e",
+                "title": "name.txt",
+                "url": "/tenders/{}/documents/ebcb5dd7f7384b0fbfbed2dc4252fa6e?download=10367238a2964ee18513f209d9b6d1d3".format(u.id),
+                "datePublished": "2016-06-01T00:00:00+03:00",
+                "dateModified": "2016-06-01T00:00:00+03:00",
+                "format": "text/plain",
+            }
+        ]
+        _id, _rev = self.db.save(data)
+        self.app.app.registry.docservice_url = 'http://localhost'
+        reports = migrate_data(self.app.app.registry, 2, dry_run=True)
+        self.assertEqual(len(reports), 1)
+        self.assertEqual(reports[0]['step'], 'from1to2')
+        self.assertEqual(reports[0]['scanned'], 1)
+        self.assertEqual(reports[0]['updated'], 1)
+        self.assertGreater(reports[0]['size'], 0)
+        self.assertIn('docs_per_second', reports[0])
+        self.assertIn('projected_seconds', reports[0])
+        self.assertEqual(get_db_schema_version(self.db), 1)
+        self.assertEqual(self.db.get(u.id)['_rev'], _rev)
+
+    def test_migrate_lazy(self):
+        set_db_schema_version(self.db, 1)
+        registry = self.app.app.registry
+        registry.settings['migration.lazy'] = 'true'
+        try:
+            self.assertEqual(migrate_data(registry), 1)
+        finally:
+            del registry.settings['migration.lazy']
+        self.assertIsNone(getattr(registry, 'migration_scheduler', None))
+        self.assertEqual(registry.contracts_schema_version, 1)
+        self.assertEqual(get_db_schema_version(self.db), 1)
+        del registry.contracts_schema_version, registry.contracts_schema_checked, registry.contracts_tenders_cache
+
+    def test_migrate_background(self):
+        set_db_schema_version(self.db, 1)
+        registry = self.app.app.registry
+        registry.settings['migration.lazy'] = 'true'
+        registry.settings['migration.background'] = 'true'
+        registry.settings['migration.throttle.docs_per_second'] = '100'
+        try:
+            self.assertEqual(migrate_data(registry), 1)
+        finally:
+            del registry.settings['migration.lazy']
+            del registry.settings['migration.background']
+            del registry.settings['migration.throttle.docs_per_second']
+        scheduler = registry.migration_scheduler
+        self.assertEqual(scheduler.throttle.docs_per_second, 100)
+        scheduler.join(10)
+        self.assertFalse(scheduler.is_alive())
+        self.assertEqual(get_db_schema_version(self.db), SCHEMA_VERSION)
+        self.assertIsNone(scheduler.status()['step'])
+        del registry.migration_scheduler
+        del registry.contracts_schema_version, registry.contracts_schema_checked, registry.contracts_tenders_cache
+
+    def test_migrate_background_settings(self):
+        set_db_schema_version(self.db, 1)
+        registry = self.app.app.registry
+        registry.settings['migration.background'] = 'true'
+        try:
+            with self.assertRaises(ConfigurationError):
+                migrate_data(registry)
+            registry.settings['migration.lazy'] = 'true'
+            registry.settings['migration.sweeper'] = 'false'
+            with self.assertRaises(ConfigurationError):
+                migrate_data(registry)
+        finally:
+            for key in ['migration.background', 'migration.lazy', 'migration.sweeper']:
+                registry.settings.pop(key, None)
+        self.assertEqual(get_db_schema_version(self.db), 1)
+        self.assertIsNone(getattr(registry, 'migration_scheduler', None))
+
+    def test_get_key_ranges(self):
+        ids = []
+        for i in xrange(10):
+            u = Contract(test_contract_data)
+            u.id = uuid4().hex
+            u.contractID = "UA-{}".format(i)
+            u.store(self.db)
+            ids.append(u.id)
+        ranges = get_key_ranges(self.db, 3)
+        self.assertEqual(len(ranges), 3)
+        self.assertNotIn('startkey', ranges[0])
+        self.assertNotIn('endkey', ranges[-1])
+        found = []
+        for options in ranges:
+            found.extend([i.id for i in self.db.view('contracts/all', **options)])
+        self.assertEqual(sorted(found), sorted(ids))
+
+    def test_migrate_from1to2_parallel(self):
+        set_db_schema_version(self.db, 1)
+        self.app.app.registry.settings['migration.workers'] = '2'
+        self.app.app.registry.docservice_url = 'http://localhost'
+        ids = []
+        for i in xrange(10):
+            u = Contract(test_contract_data)
+            u.id = uuid4().hex
+            u.contractID = "UA-{}".format(i)
+            u.store(self.db)
+            data = self.db.get(u.id)
+            data["documents"] = [
+                {
+                    "id": "ebcb5dd7f7384b0fbfbed2dc4252fa6e",
+                    "title": "name.txt",
+                    "url": "/tenders/{}/documents/ebcb5dd7f7384b0fbfbed2dc4252fa6e?download=10367238a2964ee18513f209d9b6d1d3".format(u.id),
+                    "datePublished": "2016-06-01T00:00:00+03:00",
+                    "dateModified": "2016-06-01T00:00:00+03:00",
+                    "format": "text/plain",
+                }
+            ]
+            self.db.save(data)
+            ids.append(u.id)
+        try:
+            migrate_data(self.app.app.registry, 2)
+        finally:
+            del self.app.app.registry.settings['migration.workers']
+        self.assertEqual(get_db_schema_version(self.db), 2)
+        for contract_id in ids:
+            migrated_item = self.db.get(contract_id)
+            self.assertIn('http://localhost/get/10367238a2964ee18513f209d9b6d1d3?', migrated_item['documents'][0]['url'])
+
+    def test_migrate_from1to2_resume(self):
+        set_db_schema_version(self.db, 1)
+        self.app.app.registry.docservice_url = 'http://localhost'
+        rows = []
+        for i in xrange(3):
+            u = Contract(test_contract_data)
+            u.id = uuid4().hex
+            u.contractID = "UA-{}".format(i)
+            u.store(self.db)
+            data = self.db.get(u.id)
+            data["documents"] = [
+                {
+                    "id": "ebcb5dd7f7384b0fbfbed2dc4252fa6e",
+                    "title": "name.txt",
+                    "url": "/tenders/{}/documents/ebcb5dd7f7384b0fbfbed2dc4252fa6e?download=10367238a2964ee18513f209d9b6d1d3".format(u.id),
+                    "datePublished": "2016-06-01T00:00:00+03:00",
+                    "dateModified": "2016-06-01T00:00:00+03:00",
+                    "format": "text/plain",
+                }
+            ]
+            self.db.save(data)
+            rows.append((u.contractID, u.id))
+        set_checkpoint(self.db, 'from1to2', 0, {
+            'startkey': rows[1][0], 'startkey_docid': rows[1][1], 'scanned': 1, 'updated': 1})
+        self.assertEqual(get_checkpoint(self.db, 'from1to2')['scanned'], 1)
+
+        migrate_data(self.app.app.registry, 2)
+        self.assertEqual(get_db_schema_version(self.db), 2)
+        self.assertNotIn('migration', self.db.get(SCHEMA_DOC))
+        self.assertEqual(get_checkpoint(self.db, 'from1to2'), {})
+        self.assertNotIn('http://localhost/get/', self.db.get(rows[0][1])['documents'][0]['url'])
+        for contract_id in (rows[1][1], rows[2][1]):
+            self.assertIn('http://localhost/get/', self.db.get(contract_id)['documents'][0]['url'])
+
     def test_migrate_data_return_none(self):
         self.app.app.registry.settings['plugins'] = 'fake_plugin'
         self.assertIsNone(migrate_data(self.app.app.registry))
 
 
+class TenderAwardsTest(unittest.TestCase):
+
+    def test_get_tenders_awards(self):
+        db = MagicMock()
+        db.view.return_value = [
+            MagicMock(key='t1', doc={'awards': [{'id': 'a1'}, {'id': 'a2'}]}),
+            MagicMock(key='t2', doc=None),
+        ]
+        cache = LRUCache(10)
+        awards = get_tenders_awards(db, ['t1', 't2', 't1'], cache)
+        self.assertEqual(awards, {'t1': {'a1': {'id': 'a1'}, 'a2': {'id': 'a2'}}, 't2': {}})
+        self.assertEqual(db.view.call_count, 1)
+        self.assertEqual(sorted(db.view.call_args[1]['keys']), ['t1', 't2'])
+
+        awards = get_tenders_awards(db, ['t1'], cache)
+        self.assertEqual(awards, {'t1': {'a1': {'id': 'a1'}, 'a2': {'id': 'a2'}}})
+        self.assertEqual(db.view.call_count, 1)
+
+    def test_upgrade_cached(self):
+        registry = MagicMock()
+        registry.contracts_schema_version = 0
+        registry.contracts_schema_checked = time()
+        registry.contracts_tenders_cache = ExpiringLRUCache(10, 60)
+        doc = {'id': 'c1', 'tender_id': 't1', 'awardID': 'a1'}
+        registry.db.view.return_value = [MagicMock(key='t1', doc={'awards': []})]
+        for i in xrange(2):
+            self.assertNotIn('value', upgrade_contract(registry, deepcopy(doc)))
+        self.assertEqual(registry.db.view.call_count, 1)
+
+        # tenders are not cached for longer than cache ttl
+        registry.contracts_tenders_cache = None
+        for amount in [1, 2]:
+            registry.db.view.return_value = [MagicMock(key='t1', doc={'awards': [
+                {'id': 'a1', 'suppliers': [], 'value': {'amount': amount}}]})]
+            self.assertEqual(upgrade_contract(registry, deepcopy(doc))['value'], {'amount': amount})
+        self.assertEqual(registry.db.view.call_count, 3)
+
+
+class DiffPathsTest(unittest.TestCase):
+
+    def test_diff_paths(self):
+        self.assertEqual(diff_paths({'a': 1}, {'a': 1}), [])
+        self.assertEqual(diff_paths({'a': [{'b': 1}, {'b': 2}]}, {'a': [{'b': 1}, {'b': 3}], 'c': 1}),
+                         ['/a/1/b', '/c'])
+        self.assertEqual(diff_paths({'a': [1]}, {'a': [1, 2]}), ['/a'])
+        self.assertEqual(diff_paths(1, 2), ['/'])
+
+
+class UpgradeContractTest(unittest.TestCase):
+
+    @patch('openprocurement.contracting.core.migration.upgrade1to2')
+    def test_upgrade_contract(self, mocked_upgrade1to2):
+        mocked_upgrade1to2.side_effect = lambda registry, doc: dict(doc, upgraded=True)
+        registry = MagicMock()
+        registry.contracts_schema_version = 1
+        registry.contracts_schema_checked = time()
+
+        doc = upgrade_contract(registry, {'id': 'a'})
+        self.assertEqual(doc, {'id': 'a', 'upgraded': True, 'schemaVersion': SCHEMA_VERSION})
+
+        doc = upgrade_contract(registry, {'id': 'a', 'schemaVersion': SCHEMA_VERSION})
+        self.assertEqual(doc, {'id': 'a', 'schemaVersion': SCHEMA_VERSION})
+
+        registry.contracts_schema_version = SCHEMA_VERSION
+        doc = upgrade_contract(registry, {'id': 'a'})
+        self.assertEqual(doc, {'id': 'a'})
+        self.assertEqual(mocked_upgrade1to2.call_count, 1)
+
+        mocked_upgrade1to2.side_effect = lambda registry, doc: None
+        doc = upgrade_contract(registry, {'id': 'a', 'schemaVersion': 1})
+        self.assertEqual(doc, {'id': 'a', 'schemaVersion': SCHEMA_VERSION})
+
+
+    @patch('openprocurement.contracting.core.migration.time')
+    def test_schema_version_refreshed(self, mocked_time):
+        registry = FakeRegistry()
+        set_db_schema_version(registry.db, 1)
+        registry.contracts_schema_version = 1
+        registry.contracts_schema_checked = mocked_time.return_value = 100
+        self.assertEqual(get_contracts_schema_version(registry), 1)
+
+        # migration finished by another process
+        set_db_schema_version(registry.db, SCHEMA_VERSION)
+        self.assertEqual(get_contracts_schema_version(registry), 1)
+        mocked_time.return_value = 100 + SCHEMA_CHECK_INTERVAL + 1
+        self.assertEqual(get_contracts_schema_version(registry), SCHEMA_VERSION)
+        self.assertEqual(upgrade_contract(registry, {'id': 'a'}), {'id': 'a'})
+
+        registry.db.requests.clear()
+        mocked_time.return_value += 2 * SCHEMA_CHECK_INTERVAL
+        self.assertEqual(get_contracts_schema_version(registry), SCHEMA_VERSION)
+        self.assertEqual(registry.db.requests['get'], 0)
+
+
+    def test_lazy_reads_identical(self):
+        registry = FakeRegistry(docservice_url='http://localhost', docservice_key=Signer('\0' * 32))
+        registry.contracts_schema_version = 0
+        registry.contracts_schema_checked = time()
+        data = deepcopy(test_contract_data)
+        suppliers = data.pop('suppliers')
+        data.update(_id=data.pop('id'), doc_type='Contract', dateModified='2016-06-01T00:00:00+03:00',
+                    documents=deepcopy(documents))
+        registry.db.save(data)
+        registry.db.save({'_id': data['tender_id'], 'awards': [
+            {'id': data['awardID'], 'suppliers': suppliers, 'value': data['value']}]})
+
+        def read():
+            doc = upgrade_contract(registry, registry.db.get(data['_id']))
+            contract = Contract(doc)
+            contract.__parent__ = Root(Request(registry))
+            return contract.serialize('view')
+
+        first = read()
+        self.assertEqual(first['dateModified'], data['dateModified'])
+        self.assertEqual(len(first['suppliers']), 1)
+        self.assertTrue(first['documents'][0]['url'].startswith('http://localhost/get/'))
+        self.assertEqual(read(), first)
+
+
+class ThrottleTest(unittest.TestCase):
+
+    @patch('openprocurement.contracting.core.migration.sleep')
+    def test_read(self, mocked_sleep):
+        throttle = Throttle(docs_per_second=100)
+        throttle.reset(1000)
+        throttle.read(100, 0.01)
+        self.assertEqual(mocked_sleep.call_count, 1)
+        self.assertAlmostEqual(mocked_sleep.call_args[0][0], 1, 1)
+        self.assertEqual(throttle.backlog, 900)
+        self.assertGreater(throttle.status()['rate'], 0)
+
+    @patch('openprocurement.contracting.core.migration.sleep')
+    def test_backoff(self, mocked_sleep):
+        throttle = Throttle(max_latency=0.5)
+        throttle.write(0.1)
+        self.assertEqual(throttle.slowdown, 1)
+        self.assertFalse(mocked_sleep.called)
+        throttle.write(1)
+        self.assertEqual(throttle.slowdown, 2)
+        mocked_sleep.assert_called_once_with(1)
+        for i in xrange(10):
+            throttle.write(1)
+        self.assertEqual(throttle.slowdown, MAX_SLOWDOWN)
+        throttle.write(0.1)
+        self.assertEqual(throttle.slowdown, MAX_SLOWDOWN / 2)
+        self.assertEqual(throttle.writes, 13)
+
+    def test_from_settings(self):
+        throttle = Throttle.from_settings({
+            'migration.throttle.docs_per_second': '500',
+            'migration.throttle.max_latency': '0.2'})
+        self.assertEqual(throttle.docs_per_second, 500)
+        self.assertEqual(throttle.writes_per_second, 0)
+        self.assertEqual(throttle.max_latency, 0.2)
+
+
+class FakeDatabaseMigrateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = FakeRegistry()
+        self.db = self.registry.db
+        generate_data(self.db, 3000)
+        self.db.requests.clear()
+
+    def test_view_paging(self):
+        rows = list(self.db.iterview('contracts/all', 2 ** 10))
+        self.assertEqual(len(rows), 3000)
+        self.assertEqual([i.key for i in rows], sorted([i.key for i in rows]))
+        self.assertEqual(self.db.requests['view'], 3)
+        ranges = get_key_ranges(self.db, 4)
+        self.assertEqual(sum([len(self.db.view('contracts/all', **options)) for options in ranges]), 3000)
+
+    def test_view_paging_limit(self):
+        rows = list(self.db.iterview('contracts/all', 2 ** 10, limit=1500))
+        self.assertEqual(len(rows), 1500)
+        self.assertEqual(self.db.requests['view'], 2)
+        self.assertEqual(len(list(self.db.iterview('contracts/all', 2 ** 10, limit=2 ** 10))), 2 ** 10)
+        self.assertEqual(self.db.requests['view'], 3)
+
+    def test_from0to1(self):
+        stats = run_migration_step(self.registry, from0to1)
+        self.assertEqual(stats['scanned'], 3000)
+        self.assertEqual(stats['updated'], 3000)
+        # one contracts/all and one _all_docs request per page
+        self.assertEqual(self.db.requests['view'], 3 + 3 + 1)
+        self.assertLess(self.db.requests['get'], 5)
+        for row in self.db.view('contracts/all', include_docs=True):
+            self.assertEqual(row.doc['suppliers'], test_contract_data['suppliers'])
+            self.assertEqual(row.doc['schemaVersion'], 1)
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def migrate_docs(self, docs):
+        for doc in docs:
+            if not doc.get('migrated'):
+                doc['migrated'] = True
+                yield doc
+
+    def test_write(self):
+        db = MagicMock()
+        db.update.side_effect = lambda docs: [(True, doc['_id'], 'rev') for doc in docs]
+        on_write = MagicMock()
+        writer = BulkWriter(db, self.migrate_docs, on_write)
+        writer.start()
+        for i in xrange(300):
+            writer.put({'_id': str(i)})
+        writer.mark({'scanned': 300})
+        writer.close()
+        self.assertIsNone(writer.error)
+        self.assertEqual(writer.updated, 300)
+        self.assertEqual(sum([len(i[0][0]) for i in db.update.call_args_list]), 300)
+        self.assertEqual(on_write.call_args[0], (writer, {'scanned': 300}))
+
+    def test_tune(self):
+        writer = BulkWriter(MagicMock(), self.migrate_docs, target_latency=1.0)
+        writer.tune(0.1)
+        self.assertEqual(writer.batch_size, 2 ** 8)
+        writer.tune(0.7)
+        self.assertEqual(writer.batch_size, 2 ** 8)
+        for i in xrange(10):
+            writer.tune(2)
+        self.assertEqual(writer.batch_size, MIN_WRITE_BATCH)
+
+    def test_retry_conflicts(self):
+        db = MagicMock()
+        db.update.return_value = [(True, 'a', 'rev'), (False, 'b', ResourceConflict('conflict')),
+                                  (False, 'c', ResourceConflict('conflict'))]
+        db.get.side_effect = lambda docid: {'_id': docid, 'migrated': docid == 'c'}
+        writer = BulkWriter(db, self.migrate_docs)
+        writer.flush([{'_id': 'a'}, {'_id': 'b'}, {'_id': 'c'}], None)
+        self.assertEqual(writer.updated, 2)
+        db.save.assert_called_once_with({'_id': 'b', 'migrated': True})
+        self.assertEqual(db.update.call_count, 1)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(MigrateTest))
+    suite.addTest(unittest.makeSuite(TenderAwardsTest))
+    suite.addTest(unittest.makeSuite(BulkWriterTest))
+    suite.addTest(unittest.makeSuite(DiffPathsTest))
+    suite.addTest(unittest.makeSuite(UpgradeContractTest))
+    suite.addTest(unittest.makeSuite(ThrottleTest))
+    suite.addTest(unittest.makeSuite(FakeDatabaseMigrateTest))
     return suite
 
 
@@ -4,7 +4,7 @@ import unittest
 import os
 
 from datetime import timedelta
-from mock import MagicMock
+from mock import MagicMock, patch
 from pyramid.security import Allow
 from schematics.exceptions import ValidationError
 from uuid import uuid4
@@ -14,9 +14,13 @@ from openprocurement.contracting.core.models import (
     Contract,
     Item,
     get_contract,
+    is_contract,
     CPVClassification,
     AdditionalClassification,
-    Change
+    Change,
+    compile_export,
+    LazyData,
+    LAZY_FIELDS,
 )
 from openprocurement.api.utils import get_now
 
@@ -59,6 +63,33 @@ class TestModelsFunctions(unittest.TestCase):
 
         self.assertEqual(contract, new_contract)
 
+    def test_get_contract_cached(self):
+        contract = Contract()
+        document = Document()
+        document.__parent__ = contract
+        self.assertIs(get_contract(document), contract)
+        with patch('openprocurement.contracting.core.models.is_contract', wraps=is_contract) as mocked:
+            self.assertIs(get_contract(document), contract)
+        self.assertEqual(mocked.call_count, 1)
+
+        other = Contract()
+        document.__parent__ = other
+        self.assertIs(get_contract(document), other)
+        self.assertTrue(is_contract(other))
+        self.assertFalse(is_contract(document))
+
+    def test_get_contract_ancestor_reparented(self):
+        contract = Contract()
+        item = Item()
+        item.__parent__ = contract
+        classification = CPVClassification()
+        classification.__parent__ = item
+        self.assertIs(get_contract(classification), contract)
+
+        other = Contract()
+        item.__parent__ = other
+        self.assertIs(get_contract(classification), other)
+
 
 class TestCPVClassification(unittest.TestCase):
     """Check that no exeption was rised"""
@@ -149,11 +180,123 @@ class TestContract(unittest.TestCase):
 
         self.assertEqual(self.contract.get_role(), 'edit_active')
 
+    def test_get_related(self):
+        item = self.contract.items[0]
+        self.assertIs(self.contract.get_related('item', item.id), item)
+        self.assertIsNone(self.contract.get_related('change', item.id))
+
+        change = Change({'rationale': u'причина', 'rationaleTypes': ['volumeCuts']})
+        self.contract.changes.append(change)
+        self.assertIs(self.contract.get_related('change', change.id), change)
+        replaced = Change({'id': change.id, 'status': 'active', 'rationale': u'причина',
+                           'rationaleTypes': ['volumeCuts']})
+        self.contract.changes[0] = replaced
+        self.assertIs(self.contract.get_related('change', change.id), replaced)
+        self.contract.changes = []
+        self.assertIsNone(self.contract.get_related('change', change.id))
+
+    def test_related_index(self):
+        item = self.contract.items[0]
+        with self.contract.related_index():
+            index = self.contract._related_index
+            self.assertIs(self.contract.get_related('item', item.id), item)
+            with self.contract.related_index():
+                self.assertIs(self.contract._related_index, index)
+            self.assertIs(self.contract._related_index, index)
+        self.assertNotIn('_related_index', self.contract.__dict__)
+
+    def test_plain_role(self):
+        self.contract.schemaVersion = 2
+        self.contract.revisionsArchived = 100
+        data = self.contract.serialize('plain')
+        self.assertNotIn('schemaVersion', data)
+        self.assertNotIn('revisionsArchived', data)
+
     def test_contract_amountPaid(self):
         self.assertEqual(self.contract.serialize()['amountPaid'],
                          self.amountPaid)
 
 
+class TestCompiledSerializer(unittest.TestCase):
+    """ Compiled exports give the same output as schematics export """
+
+    def setUp(self):
+        path = os.path.dirname(__file__) + '/data/tender-contract-complete.json'
+        with open(path) as temp_file:
+            data = json.load(temp_file)['contracts'][0]
+        data.update({
+            'id': uuid4().hex,
+            'tender_id': uuid4().hex,
+            'tender_token': uuid4().hex,
+            'owner': 'broker',
+            'amountPaid': {'amount': 100.0, 'currency': 'UAH', 'valueAddedTaxIncluded': True},
+            'documents': [{'title': u'paper.doc', 'url': 'http://localhost/doc', 'format': 'application/msword'}],
+            'changes': [{'rationale': u'причина', 'rationaleTypes': ['volumeCuts']}],
+        })
+        self.contract = Contract(data)
+
+    def test_contract_roles(self):
+        for role in ['view', 'plain', 'Administrator', 'edit_active', 'edit_terminated', 'create', 'default', None]:
+            self.assertEqual(self.contract.serialize(role), self.contract.to_primitive(role), role)
+        self.assertIn('amountPaid', self.contract.serialize('view'))
+        with self.assertRaises(ValueError):
+            self.contract.serialize('missing')
+
+    def test_embedded_roles(self):
+        for role in ['view', 'edit', 'embedded']:
+            self.assertEqual(self.contract.changes[0].serialize(role),
+                             self.contract.changes[0].to_primitive(role))
+        self.assertEqual(self.contract.documents[0].serialize('view'),
+                         self.contract.documents[0].to_primitive('view'))
+
+    def test_compile_once(self):
+        self.assertIs(compile_export(Contract, 'view'), compile_export(Contract, 'view'))
+        self.assertIsNot(compile_export(Contract, 'view'), compile_export(Contract, 'plain'))
+
+
+class TestLazyContract(unittest.TestCase):
+    """ Contract with compound fields converted on first access """
+
+    def setUp(self):
+        path = os.path.dirname(__file__) + '/data/tender-contract-complete.json'
+        with open(path) as temp_file:
+            self.data = json.load(temp_file)['contracts'][0]
+        self.data.update({
+            'tender_id': uuid4().hex,
+            'tender_token': uuid4().hex,
+            'documents': [{'title': u'paper.doc', 'url': 'http://localhost/doc', 'format': 'application/msword'}],
+        })
+        self.contract = Contract(self.data, lazy_fields=LAZY_FIELDS)
+
+    def test_raw_until_access(self):
+        self.assertIsInstance(self.contract._data, LazyData)
+        self.assertIn('documents', self.contract._data.pending)
+        self.assertIsInstance(dict.__getitem__(self.contract._data, 'documents')[0], dict)
+
+        document = self.contract.documents[0]
+        self.assertIsInstance(document, Document)
+        self.assertIs(document.__parent__, self.contract)
+        self.assertNotIn('documents', self.contract._data.pending)
+        self.assertIn('items', self.contract._data.pending)
+
+    def test_same_as_eager(self):
+        contract = Contract(self.data)
+        self.assertNotIsInstance(contract._data, LazyData)
+        for role in ['view', 'plain', 'edit_active']:
+            self.assertEqual(self.contract.serialize(role), contract.serialize(role))
+        self.contract.validate()
+        self.assertEqual(self.contract._data.pending, set())
+
+    def test_not_lazy_by_default(self):
+        self.assertNotIsInstance(Contract(self.data)._data, LazyData)
+        self.assertNotIsInstance(type('PluginContract', (Contract,), {})(self.data)._data, LazyData)
+
+    def test_set_before_access(self):
+        self.contract.documents = []
+        self.assertEqual(self.contract.documents, [])
+        self.assertNotIn('documents', self.contract._data.pending)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestDocument))
@@ -162,6 +305,8 @@ def suite():
     suite.addTest(unittest.makeSuite(TestAdditionalClassification))
     suite.addTest(unittest.makeSuite(TestChange))
     suite.addTest(unittest.makeSuite(TestContract))
+    suite.addTest(unittest.makeSuite(TestCompiledSerializer))
+    suite.addTest(unittest.makeSuite(TestLazyContract))
     return suite
 
 
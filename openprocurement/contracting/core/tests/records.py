@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import unittest
+from copy import deepcopy
+from uuid import uuid4
+
+from openprocurement.contracting.core.models import Contract, Organization
+from openprocurement.contracting.core.records import (
+    Interner,
+    Record,
+    contract_record,
+    iter_contract_records,
+    record_class,
+)
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.tests.fakedb import FakeDatabase
+
+
+class TestContractRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.data = deepcopy(test_contract_data)
+        self.data['_id'] = self.data.pop('id')
+        self.data['doc_type'] = 'Contract'
+
+    def test_record(self):
+        record = contract_record(self.data)
+        self.assertIsInstance(record, record_class(Contract))
+        self.assertEqual(record.contractID, self.data['contractID'])
+        self.assertEqual(record['_id'], self.data['_id'])
+        self.assertIsInstance(record.suppliers, tuple)
+        self.assertIsInstance(record.suppliers[0], record_class(Organization))
+        self.assertEqual(record.suppliers[0].contactPoint.name,
+                         self.data['suppliers'][0]['contactPoint']['name'])
+        self.assertEqual(record.items[0].classification.id, self.data['items'][0]['classification']['id'])
+        self.assertIsNone(record.amountPaid)
+        self.assertEqual(record.to_primitive(), self.data)
+        self.assertEqual(record, contract_record(deepcopy(self.data)))
+
+    def test_compact(self):
+        record = contract_record(self.data)
+        for value in [record, record.procuringEntity, record.items[0], record.items[0].unit]:
+            self.assertIsInstance(value, Record)
+            self.assertFalse(hasattr(value, '__dict__'))
+
+    def test_read_only(self):
+        record = contract_record(self.data)
+        with self.assertRaises(AttributeError):
+            record.status = 'terminated'
+        with self.assertRaises(AttributeError):
+            del record.status
+        with self.assertRaises(AttributeError):
+            record.extra = True
+
+    def test_read_only_dicts(self):
+        self.data['_attachments'] = {'a.txt': {'content_type': 'text/plain', 'revpos': [1]}}
+        record = contract_record(self.data)
+        with self.assertRaises(TypeError):
+            record._attachments['b.txt'] = {}
+        with self.assertRaises(TypeError):
+            record._attachments['a.txt'].update(length=1)
+        self.assertEqual(record._attachments['a.txt']['revpos'], (1,))
+        self.assertEqual(record.to_primitive()['_attachments'], self.data['_attachments'])
+        self.assertEqual(deepcopy(record._attachments), record._attachments)
+
+    def test_interned_organizations(self):
+        interner = Interner(size=2)
+        first = contract_record(self.data, interner=interner)
+        second = contract_record(deepcopy(self.data), interner=interner)
+        self.assertIs(first.procuringEntity, second.procuringEntity)
+        self.assertIs(first.suppliers[0], second.suppliers[0])
+        self.assertIsNot(first.items[0], second.items[0])
+        self.assertEqual((interner.hits, interner.misses), (2, 2))
+
+        self.data['procuringEntity']['name'] = u'Інше управління'
+        third = contract_record(self.data, interner=interner)
+        self.assertIsNot(third.procuringEntity, first.procuringEntity)
+        self.assertEqual(third.procuringEntity.name, u'Інше управління')
+        self.assertEqual(third.to_primitive(), self.data)
+
+    def test_iter_contract_records(self):
+        db = FakeDatabase()
+        for i in xrange(5):
+            db.save(dict(self.data, _id=uuid4().hex, contractID='UA-{}'.format(i)))
+        records = list(iter_contract_records(db, page_size=2))
+        self.assertEqual([i.contractID for i in records], ['UA-{}'.format(i) for i in xrange(5)])
+        self.assertIs(records[0].procuringEntity, records[4].procuringEntity)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestContractRecord))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
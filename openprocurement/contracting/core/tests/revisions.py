@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import unittest
+from copy import deepcopy
+from uuid import uuid4
+
+from mock import MagicMock
+from pyramid.exceptions import ConfigurationError
+from schematics.exceptions import ModelValidationError
+
+from openprocurement.api.models import Revision
+from openprocurement.contracting.core.models import Contract
+from openprocurement.contracting.core.revisions import (
+    archive_revisions,
+    archive_stored_revisions,
+    check_revisions_readers,
+    contract_revisions,
+    load_revisions,
+    revisions_doc_id,
+    REVISIONS_CHUNK_SIZE,
+    REVISIONS_DOC_TYPE,
+)
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.tests.fakedb import FakeDatabase
+
+
+class TestArchiveRevisions(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        data = deepcopy(test_contract_data)
+        data.update({'id': uuid4().hex, 'tender_token': uuid4().hex})
+        self.contract = Contract(data)
+        self.add_revisions(REVISIONS_CHUNK_SIZE + 5)
+
+    def add_revisions(self, count):
+        start = len(self.contract.revisions) + (self.contract.revisionsArchived or 0)
+        self.contract.revisions = self.contract.revisions + [
+            Revision({'author': 'broker', 'rev': str(i), 'changes': [{'op': 'add', 'path': '/n', 'value': i}]})
+            for i in xrange(start, start + count)]
+
+    def test_nothing_to_archive(self):
+        self.assertEqual(archive_revisions(self.db, self.contract, tail=10), 0)
+        self.assertEqual(len(self.db), 0)
+        self.assertEqual(load_revisions(self.db, self.contract), self.contract.revisions)
+
+    def test_archive_and_load(self):
+        self.assertEqual(archive_revisions(self.db, self.contract, tail=5), REVISIONS_CHUNK_SIZE)
+        self.assertEqual(self.contract.revisionsArchived, REVISIONS_CHUNK_SIZE)
+        self.assertEqual([i.rev for i in self.contract.revisions], [str(i) for i in xrange(100, 105)])
+        doc = self.db.get(revisions_doc_id(self.contract.id, 0))
+        self.assertEqual(doc['doc_type'], REVISIONS_DOC_TYPE)
+        self.assertEqual(len(doc['revisions']), REVISIONS_CHUNK_SIZE)
+
+        self.add_revisions(REVISIONS_CHUNK_SIZE)
+        self.assertEqual(archive_revisions(self.db, self.contract, tail=5), REVISIONS_CHUNK_SIZE)
+        self.assertEqual(len(self.db), 2)
+
+        self.db.requests.clear()
+        revisions = load_revisions(self.db, self.contract)
+        self.assertEqual(self.db.requests['view'], 1)
+        self.assertEqual([i.rev for i in revisions], [str(i) for i in xrange(2 * REVISIONS_CHUNK_SIZE + 5)])
+        self.assertIsInstance(revisions[0], Revision)
+
+    def test_archive_again(self):
+        contract = Contract(self.contract.to_primitive())
+        archive_revisions(self.db, self.contract, tail=5)
+        # contract save failed, chunk is written again
+        self.assertEqual(archive_revisions(self.db, contract, tail=5), REVISIONS_CHUNK_SIZE)
+        self.assertEqual(len(load_revisions(self.db, contract)), REVISIONS_CHUNK_SIZE + 5)
+
+    def test_archive_existing(self):
+        doc_id = revisions_doc_id(self.contract.id, 0)
+        archive_revisions(self.db, Contract(self.contract.to_primitive()), tail=5)
+        rev = self.db.get(doc_id)['_rev']
+        self.assertEqual(archive_revisions(self.db, self.contract, tail=5), REVISIONS_CHUNK_SIZE)
+        doc = self.db.get(doc_id)
+        self.assertEqual(doc['_rev'], rev)
+        self.assertEqual(len(doc['revisions']), REVISIONS_CHUNK_SIZE)
+
+    def test_contract_revisions(self):
+        archive_revisions(self.db, self.contract, tail=5)
+        request = MagicMock()
+        request.registry.db = self.db
+        request.contract = self.contract
+        self.assertEqual([i.rev for i in contract_revisions(request)],
+                         [str(i) for i in xrange(REVISIONS_CHUNK_SIZE + 5)])
+
+    def test_store(self):
+        data = self.contract.to_primitive()
+        data['_id'] = data['id'] = uuid4().hex
+        contract = Contract(data)
+        contract.store(self.db)
+        self.assertIsNone(contract.revisionsArchived)
+
+        self.contract.__parent__ = MagicMock()
+        self.contract.__parent__.request.registry.contract_revisions_tail = 5
+        self.contract.store(self.db)
+        self.assertEqual(self.contract.revisionsArchived, REVISIONS_CHUNK_SIZE)
+        self.assertEqual(len(self.db.get(self.contract.id)['revisions']), 5)
+
+    def test_store_failed(self):
+        self.contract.__parent__ = MagicMock()
+        self.contract.__parent__.request.registry.contract_revisions_tail = 5
+        self.contract.procuringEntity = None
+        with self.assertRaises(ModelValidationError):
+            self.contract.store(self.db)
+        self.assertEqual(len(self.db), 0)
+        self.assertIsNone(self.contract.revisionsArchived)
+
+    def test_store_conflict(self):
+        contract = Contract(self.contract.to_primitive())
+        contract.store(self.db)
+        self.db.save(self.db.get(contract.id))
+        saved = contract._rev
+        # second save without revisions conflicts, revisions are kept
+        self.assertEqual(archive_stored_revisions(self.db, contract, tail=5), 0)
+        self.assertEqual(contract._rev, saved)
+        self.assertIsNone(contract.revisionsArchived)
+        self.assertEqual(len(contract.revisions), REVISIONS_CHUNK_SIZE + 5)
+        self.assertEqual(len(self.db.get(revisions_doc_id(contract.id, 0))['revisions']), REVISIONS_CHUNK_SIZE)
+
+
+class TestRevisionsReaders(unittest.TestCase):
+
+    def test_check_revisions_readers(self):
+        event = MagicMock()
+        event.app.registry.contract_revisions_tail = None
+        event.app.registry.contract_revisions_readers = []
+        check_revisions_readers(event)
+        event.app.registry.contract_revisions_tail = 5
+        with self.assertRaises(ConfigurationError):
+            check_revisions_readers(event)
+        event.app.registry.contract_revisions_readers = ['Contract Revisions']
+        check_revisions_readers(event)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestArchiveRevisions))
+    suite.addTest(unittest.makeSuite(TestRevisionsReaders))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import unittest
+from copy import deepcopy
+from uuid import uuid4
+from StringIO import StringIO
+
+from openprocurement.contracting.core.models import Contract
+from openprocurement.contracting.core.scan import (
+    error_paths,
+    load_contract_types,
+    scan_contracts,
+    validate_contracts,
+    ERROR_PATH,
+    ScanReport
+)
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.tests.fakedb import FakeDatabase
+
+
+class TestErrorPaths(unittest.TestCase):
+
+    def test_error_paths(self):
+        messages = {
+            'items': [u'Items should be unique'],
+            'suppliers': [{'contactPoint': {'name': [u'This field is required.']}}],
+            'documents': {0: {'relatedItem': [u'relatedItem should be one of items']}},
+        }
+        self.assertEqual(error_paths(messages), [
+            ('documents.*.relatedItem', u'relatedItem should be one of items'),
+            ('items', u'Items should be unique'),
+            ('suppliers.*.contactPoint.name', u'This field is required.'),
+        ])
+
+
+class BrokenContract(Contract):
+
+    def validate(self, *args, **kwargs):
+        raise ValueError('broken')
+
+
+class FailingReport(ScanReport):
+
+    def add(self, scanned, errors):
+        raise RuntimeError('failed')
+
+
+class TestScanContracts(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.invalid = []
+        docs = []
+        for i in xrange(20):
+            doc = deepcopy(test_contract_data)
+            doc.update({'_id': uuid4().hex, 'doc_type': 'Contract', 'contractID': 'UA-{}'.format(i)})
+            if i % 5 == 0:
+                doc['items'] = doc['items'] * 2
+                self.invalid.append(doc['_id'])
+            docs.append(doc)
+        self.db.update(docs)
+
+    def test_validate_contracts(self):
+        docs = [row.doc for row in self.db.view('contracts/all', include_docs=True)]
+        scanned, errors = validate_contracts(docs)
+        self.assertEqual(scanned, 20)
+        self.assertEqual(sorted([i[0] for i in errors]), sorted(self.invalid))
+        self.assertEqual(set([i[1] for i in errors]), set(['items']))
+
+    def test_validate_contracts_types(self):
+        docs = [row.doc for row in self.db.view('contracts/all', include_docs=True)][:3]
+        docs[0]['items'] = test_contract_data['items'] * 2
+        docs[1]['contractType'] = 'broken'
+        docs[2]['contractType'] = 'unknown'
+        scanned, errors = validate_contracts(docs, {'common': Contract, 'broken': BrokenContract})
+        self.assertEqual(scanned, 3)
+        self.assertEqual([i[:2] for i in errors], [
+            (docs[0]['_id'], 'items'),
+            (docs[1]['_id'], ERROR_PATH),
+            (docs[2]['_id'], 'contractType'),
+        ])
+        self.assertEqual(errors[1][2], u'ValueError: broken')
+
+    def test_load_contract_types(self):
+        self.assertEqual(load_contract_types(['common=openprocurement.contracting.core.models:Contract']),
+                         {'common': Contract})
+
+    def test_scan_contracts(self):
+        output = StringIO()
+        report = scan_contracts(self.db, page_size=3, report=ScanReport(output, sample_size=2)).as_dict()
+        self.assertEqual(report['scanned'], 20)
+        self.assertEqual(report['failed'], 4)
+        self.assertEqual(report['paths'].keys(), ['items'])
+        self.assertEqual(report['paths']['items']['count'], 4)
+        self.assertEqual(len(report['paths']['items']['ids']), 2)
+        self.assertEqual(len(output.getvalue().splitlines()), 4)
+
+    def test_scan_contracts_parallel(self):
+        report = scan_contracts(self.db, workers=2, page_size=3)
+        self.assertEqual(report.scanned, 20)
+        self.assertEqual(report.failed, 4)
+
+    def test_scan_contracts_parallel_error(self):
+        with self.assertRaises(RuntimeError):
+            scan_contracts(self.db, workers=2, page_size=1, report=FailingReport())
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestErrorPaths))
+    suite.addTest(unittest.makeSuite(TestScanContracts))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import unittest
+from uuid import uuid4
+
+from couchdb.http import ResourceNotFound
+from mock import MagicMock
+from pyramid.request import Request
+from pyramid.response import Response
+
+from openprocurement.contracting.core.models import Contract
+from openprocurement.contracting.core.tweens import (
+    conditional_get_tween_factory,
+    conditional_path,
+    contract_etag,
+    get_contract_rev,
+)
+
+
+class TestConditionalGet(unittest.TestCase):
+
+    def setUp(self):
+        self.contract_id = uuid4().hex
+        self.registry = MagicMock()
+        self.registry.contract_route_prefix = '/api/2.4'
+        self.registry.db.resource.head.return_value = (200, {'etag': '"2-b"'}, None)
+        self.contract = Contract({'_id': self.contract_id, '_rev': '2-b'})
+
+        def view(request):
+            request.contract = self.contract
+            return Response('{}')
+        self.handler = MagicMock(side_effect=view)
+        self.tween = conditional_get_tween_factory(self.handler, self.registry)
+
+    def get(self, path='', etag=None, method='GET', query=''):
+        request = Request.blank('/api/2.4/contracts/{}{}{}'.format(self.contract_id, path, query), method=method)
+        if etag:
+            request.headers['If-None-Match'] = '"{}"'.format(etag)
+        return self.tween(request)
+
+    def etag(self, path='', query=''):
+        return contract_etag('2-b', Request.blank('/api/2.4/contracts/{}{}{}'.format(self.contract_id, path, query)))
+
+    def test_get_contract_rev(self):
+        self.assertEqual(get_contract_rev(self.registry.db, self.contract_id), '2-b')
+        self.registry.db.resource.head.side_effect = ResourceNotFound()
+        self.assertIsNone(get_contract_rev(self.registry.db, self.contract_id))
+
+    def test_conditional_path(self):
+        contract_id = uuid4().hex
+        for prefix in ['/api/2.4', 'api/2.4/', '/api/2.4/']:
+            self.assertTrue(conditional_path(prefix).match('/api/2.4/contracts/{}'.format(contract_id)))
+        self.assertFalse(conditional_path('/api/2.4').match('/api/2.3/contracts/{}'.format(contract_id)))
+        self.assertTrue(conditional_path(None).match('/contracts/{}/documents'.format(contract_id)))
+        self.assertFalse(conditional_path('/api/2.4').match('/api/2.4/contracts/{}/credentials'.format(contract_id)))
+
+    def test_contract_etag(self):
+        etag = contract_etag('2-b', Request.blank('/contracts/a?opt_pretty=1&all=1'))
+        self.assertTrue(etag.startswith('2-b-'))
+        self.assertEqual(contract_etag('2-b', Request.blank('/contracts/a?all=1&opt_pretty=1')), etag)
+        self.assertNotEqual(contract_etag('2-b', Request.blank('/contracts/a?opt_jsonp=1')), etag)
+        self.assertNotEqual(contract_etag('2-b', Request.blank('/contracts/a/changes?opt_pretty=1&all=1')), etag)
+        self.assertNotEqual(contract_etag('2-b', Request.blank('/contracts/a')),
+                            contract_etag('2-b', Request.blank('/contracts/a/changes')))
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'].strip('"'), self.etag())
+        self.assertFalse(self.registry.db.resource.head.called)
+
+    def test_not_modified(self):
+        for path in ['', '/changes', '/documents/{}'.format(uuid4().hex)]:
+            self.get(path)
+            response = self.get(path, etag=self.etag(path))
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.headers['ETag'].strip('"'), self.etag(path))
+        self.assertEqual(self.handler.call_count, 3)
+
+    def test_other_path(self):
+        self.get()
+        # validator of the contract doesn't match its documents
+        response = self.get('/documents/{}'.format(uuid4().hex), etag=self.etag())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.handler.call_count, 2)
+
+    def test_query(self):
+        self.get()
+        response = self.get('/documents', etag=self.etag('/documents'), query='?all=1')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag'].strip('"')
+        self.assertEqual(etag, self.etag('/documents', '?all=1'))
+        self.assertEqual(self.get('/documents', etag=etag, query='?all=1').status_code, 304)
+        self.assertEqual(self.get('/documents', etag=etag, query='?all=1&opt_pretty=1').status_code, 200)
+
+    def test_unknown_id(self):
+        response = self.get(etag=self.etag())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.registry.db.resource.head.called)
+
+    def test_not_contract(self):
+        def view(request):
+            request.contract = None
+            return Response('{}', status=404)
+        self.handler.side_effect = view
+        self.get()
+        response = self.get(etag=self.etag())
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response.headers)
+        self.assertFalse(self.registry.db.resource.head.called)
+
+    def test_modified(self):
+        self.get()
+        response = self.get(etag=contract_etag('1-a', Request.blank('/api/2.4/contracts/{}'.format(self.contract_id))))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'].strip('"'), self.etag())
+
+    def test_other_requests(self):
+        self.get()
+        response = self.get('/credentials', etag=self.etag('/credentials'))
+        self.assertNotIn('ETag', response.headers)
+        response = self.get(etag=self.etag(), method='PATCH')
+        self.assertNotIn('ETag', response.headers)
+        self.assertEqual(self.handler.call_count, 3)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestConditionalGet))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 import unittest
+from copy import deepcopy
 
 from mock import MagicMock, patch
 from pyramid.request import Request
 from schematics.types import StringType
 
 from openprocurement.contracting.core.models import Contract as BaseContract
+from openprocurement.contracting.core.tests.base import test_contract_data
 from openprocurement.contracting.core.utils import isContract, \
-    register_contract_contractType, apply_patch, set_ownership
+    register_contract_contractType, apply_patch, set_ownership, \
+    contract_from_data
 
 
 class Contract(BaseContract):
@@ -72,11 +75,98 @@ class TestUtilsFucntions(unittest.TestCase):
 
         self.assertEqual(apply_patch(request, data=data, save=True), True)
 
+    @patch('openprocurement.contracting.core.utils.save_contract',
+           return_value=True)
+    def test_apply_patch_touched_fields(self, mocked_save_contract):
+        request = MagicMock()
+        request.validated = {}
+        request.context = Contract(deepcopy(test_contract_data))
+        owner_token = request.context.owner_token
+        items = request.context.items
+        request.context.serialize = MagicMock(wraps=request.context.serialize)
+
+        data = {'terminationDetails': u'причина', 'contractNumber': test_contract_data['contractNumber']}
+        self.assertEqual(apply_patch(request, data=data), True)
+        request.context.serialize.assert_called_once_with(fields=data.keys())
+        self.assertEqual(request.context.terminationDetails, u'причина')
+        self.assertEqual(request.context.owner_token, owner_token)
+        self.assertIs(request.context.items, items)
+
+        mocked_save_contract.reset_mock()
+        self.assertEqual(apply_patch(request, data={'terminationDetails': u'причина'}), None)
+        self.assertFalse(mocked_save_contract.called)
+
+    @patch('openprocurement.contracting.core.utils.save_contract',
+           return_value=True)
+    def test_apply_patch_validated_fields(self, mocked_save_contract):
+        request = MagicMock()
+        request.context = Contract(deepcopy(test_contract_data))
+        data = request.context.to_patch()
+        data['terminationDetails'] = u'причина'
+        request.validated = {'data': data, 'patch_fields': ['terminationDetails']}
+        request.context.serialize = MagicMock(wraps=request.context.serialize)
+        request.context.import_data = MagicMock(wraps=request.context.import_data)
+
+        self.assertEqual(apply_patch(request), True)
+        request.context.serialize.assert_called_once_with(fields=['terminationDetails'])
+        request.context.import_data.assert_called_once_with({'terminationDetails': u'причина'})
+        self.assertEqual(request.context.terminationDetails, u'причина')
+
+    @patch('openprocurement.contracting.core.utils.save_contract',
+           return_value=True)
+    def test_apply_patch_registered_type(self, mocked_save_contract):
+        config = MagicMock()
+        config.registry.contract_contractTypes = {}
+        register_contract_contractType(config, Contract)
+        request = MagicMock()
+        request.context = config.registry.contract_contractTypes['common'](deepcopy(test_contract_data))
+        # fully validated data, with touched fields recorded
+        data = request.context.to_patch()
+        data['terminationDetails'] = u'причина'
+        request.validated = {'data': data, 'patch_fields': ['terminationDetails']}
+        request.context.serialize = MagicMock(wraps=request.context.serialize)
+
+        self.assertEqual(apply_patch(request), True)
+        request.context.serialize.assert_called_once_with(fields=['terminationDetails'])
+        self.assertEqual(request.context.terminationDetails, u'причина')
+
     def test_set_ownership(self):
         item = MagicMock()
         set_ownership(item, None)
         self.assertIsNotNone(item.owner_token)
 
+    @patch('openprocurement.contracting.core.utils.base_contract_from_data')
+    @patch('openprocurement.contracting.core.utils.upgrade_contract')
+    def test_contract_from_data(self, mocked_upgrade_contract,
+                                mocked_base_contract_from_data):
+        request = MagicMock()
+        request.registry.contract_lazy_fields = ()
+        data = {'status': 'active'}
+        mocked_upgrade_contract.return_value = {'status': 'active',
+                                                'schemaVersion': 2}
+        mocked_base_contract_from_data.return_value = 'contract'
+
+        self.assertEqual(contract_from_data(request, data), 'contract')
+        mocked_upgrade_contract.assert_called_once_with(request.registry, data)
+        mocked_base_contract_from_data.assert_called_once_with(
+            request, {'status': 'active', 'schemaVersion': 2}, True, True)
+
+        contract_from_data(request, data, create=False)
+        self.assertEqual(mocked_upgrade_contract.call_count, 1)
+
+    @patch('openprocurement.contracting.core.utils.base_contract_from_data')
+    @patch('openprocurement.contracting.core.utils.upgrade_contract')
+    def test_contract_from_data_lazy(self, mocked_upgrade_contract,
+                                     mocked_base_contract_from_data):
+        request = MagicMock()
+        request.registry.contract_lazy_fields = ('items',)
+        mocked_upgrade_contract.side_effect = lambda registry, data: data
+        model = mocked_base_contract_from_data.return_value
+
+        self.assertEqual(contract_from_data(request, {'status': 'active'}), model.return_value)
+        mocked_base_contract_from_data.assert_called_once_with(request, {'status': 'active'}, True, create=False)
+        model.assert_called_once_with({'status': 'active'}, lazy_fields=('items',))
+
 
 def suite():
     suite = unittest.TestSuite()
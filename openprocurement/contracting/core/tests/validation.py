@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import unittest
+from copy import deepcopy
 
-from mock import patch
+from mock import patch, MagicMock
 from pyramid.request import Request
+from schematics.types import StringType
+from schematics.types.compound import ListType, ModelType
 
-from openprocurement.contracting.core.models import Contract, Change
+from openprocurement.contracting.core.models import Contract, Change, Document
+from openprocurement.contracting.core.tests.base import test_contract_data
+from openprocurement.contracting.core.utils import register_contract_contractType
 from openprocurement.contracting.core.validation import (
     validate_patch_contract_data,
     validate_change_data,
@@ -33,6 +38,107 @@ class TestValidationFucntions(unittest.TestCase):
         self.request.contract = self.contract
         self.assertEquals(validate_patch_contract_data(self.request), True)
 
+    @patch('openprocurement.contracting.core.validation.error_handler',
+           return_value=ValueError('invalid'))
+    @patch('openprocurement.contracting.core.validation.validate_data')
+    @patch('openprocurement.contracting.core.validation.validate_json_data')
+    def test_validate_patch_contract_data_touched_fields(self, mocker_validate_json_data,
+                                                         mocker_validate_data, mocker_error_handler):
+        contract = Contract(deepcopy(test_contract_data))
+        contract.get_role = MagicMock(return_value='edit_active')
+        contract.items[0].validate = MagicMock()
+        request = MagicMock()
+        request.contract = request.context = contract
+        request.validated = {}
+
+        mocker_validate_json_data.return_value = {'terminationDetails': u'причина'}
+        data = validate_patch_contract_data(request)
+        self.assertEqual(request.validated['data'], data)
+        self.assertEqual(data['terminationDetails'], u'причина')
+        self.assertEqual(data['status'], 'active')
+        self.assertNotIn('items', data)
+        self.assertNotIn('value', data)
+        self.assertEqual(request.validated['patch_fields'], ['terminationDetails'])
+        self.assertIsNone(contract.terminationDetails)
+        self.assertFalse(contract.items[0].validate.called)
+        self.assertFalse(mocker_validate_data.called)
+
+        mocker_validate_json_data.return_value = {'status': 'unknown'}
+        with self.assertRaises(ValueError):
+            validate_patch_contract_data(request)
+        request.errors.add.assert_called_once_with('body', 'status', [u"Value must be one of ['terminated', 'active']."])
+        self.assertEqual(contract.status, 'active')
+
+        # unknown fields are reported by full validation
+        mocker_validate_json_data.return_value = {'unknown': 1}
+        validate_patch_contract_data(request)
+        mocker_validate_data.assert_called_once_with(request, Contract, True, data={'unknown': 1})
+
+    @patch('openprocurement.contracting.core.validation.error_handler',
+           return_value=ValueError('invalid'))
+    @patch('openprocurement.contracting.core.validation.validate_data')
+    @patch('openprocurement.contracting.core.validation.validate_json_data')
+    def test_validate_patch_contract_data_required_fields(self, mocker_validate_json_data,
+                                                          mocker_validate_data, mocker_error_handler):
+        data = deepcopy(test_contract_data)
+        del data['tender_id']
+        contract = Contract(data)
+        contract.get_role = MagicMock(return_value='edit_active')
+        request = MagicMock()
+        request.contract = request.context = contract
+        request.validated = {}
+
+        mocker_validate_json_data.return_value = {'terminationDetails': u'причина'}
+        with self.assertRaises(ValueError):
+            validate_patch_contract_data(request)
+        request.errors.add.assert_called_once_with('body', 'tender_id', [u'This field is required.'])
+        self.assertFalse(mocker_validate_data.called)
+
+    @patch('openprocurement.contracting.core.validation.validate_data')
+    @patch('openprocurement.contracting.core.validation.validate_json_data')
+    def test_validate_patch_contract_data_subclass(self, mocker_validate_json_data, mocker_validate_data):
+        class PluginContract(Contract):
+            contractType = StringType(choices=['plugin'], default='plugin')
+
+        class ValidatedContract(PluginContract):
+            contractType = StringType(choices=['validated'], default='validated')
+
+            def validate_terminationDetails(self, data, value):
+                pass
+
+        class DocumentedContract(PluginContract):
+            contractType = StringType(choices=['documented'], default='documented')
+            notices = ListType(ModelType(Document), default=list())
+
+        config = MagicMock()
+        config.registry.contract_contractTypes = {}
+        for model in (PluginContract, ValidatedContract, DocumentedContract):
+            register_contract_contractType(config, model)
+        mocker_validate_json_data.return_value = {'terminationDetails': u'причина'}
+
+        # dependencies of Contract are inherited
+        contract = config.registry.contract_contractTypes['plugin'](deepcopy(test_contract_data))
+        contract.get_role = MagicMock(return_value='edit_active')
+        request = MagicMock()
+        request.contract = request.context = contract
+        request.validated = {}
+        data = validate_patch_contract_data(request)
+        self.assertEqual(data['terminationDetails'], u'причина')
+        self.assertNotIn('items', data)
+        self.assertEqual(request.validated['patch_fields'], ['terminationDetails'])
+        self.assertFalse(mocker_validate_data.called)
+
+        # new model validators or compound fields need full validation
+        for contractType in ('validated', 'documented'):
+            model = config.registry.contract_contractTypes[contractType]
+            mocker_validate_data.reset_mock()
+            request = MagicMock()
+            request.contract = request.context = model(deepcopy(test_contract_data))
+            request.validated = {}
+            validate_patch_contract_data(request)
+            mocker_validate_data.assert_called_once_with(request, model, True, data={'terminationDetails': u'причина'})
+            self.assertEqual(request.validated['patch_fields'], ['terminationDetails'])
+
     @patch(
         'openprocurement.contracting.core.validation.update_logging_context')
     @patch('openprocurement.contracting.core.validation.validate_json_data')
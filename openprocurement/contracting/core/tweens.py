@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+""" Conditional GET of contracts and their changes and documents.
+
+Responses carry a strong ETag made of the stored contract `_rev`, which
+changes on every save of the contract or any of its changes and documents,
+and of the request path and query string, which select the resource and
+its representation (`opt_pretty`, `opt_jsonp`, `all` etc.). Requests with
+matching `If-None-Match` are answered with 304 after a HEAD request to the
+database, before the contract is loaded or serialized. Only ids this
+process has already served as contracts are answered so, other documents
+of the database are left to the views.
+"""
+import re
+from collections import OrderedDict
+from hashlib import md5
+from threading import Lock
+from urllib import urlencode
+
+from couchdb.http import ResourceNotFound
+from pyramid.response import Response
+
+from openprocurement.contracting.core.models import IContract
+
+CONDITIONAL_PATH = r'^{}/contracts/(?P<contract_id>[0-9a-f]{{32}})(/(changes|documents)(/[0-9a-f]{{32}})?)?$'
+KNOWN_CONTRACTS_SIZE = 2 ** 16
+
+
+def get_contract_rev(db, contract_id):
+    """ Return `_rev` of stored contract without loading it """
+    try:
+        status, headers, body = db.resource.head(contract_id)
+    except ResourceNotFound:
+        return None
+    return (headers.get('etag') or '').strip('"') or None
+
+
+def conditional_path(route_prefix=None):
+    """ Pattern of contract, changes and documents paths under `route_prefix` """
+    prefix = '/' + route_prefix.strip('/') if route_prefix and route_prefix.strip('/') else ''
+    return re.compile(CONDITIONAL_PATH.format(re.escape(prefix)))
+
+
+def contract_etag(rev, request):
+    """ ETag of request resource and representation of contract with `rev` """
+    query = sorted([(k.encode('utf-8'), v.encode('utf-8')) for k, v in request.GET.items()])
+    return '{}-{}'.format(rev, md5('{}?{}'.format(request.path, urlencode(query))).hexdigest())
+
+
+class KnownContracts(object):
+    """ Bounded set of ids of documents served as contracts """
+
+    def __init__(self, size=KNOWN_CONTRACTS_SIZE):
+        self.size = size
+        self._ids = OrderedDict()
+        self._lock = Lock()
+
+    def __contains__(self, contract_id):
+        return contract_id in self._ids
+
+    def add(self, contract_id):
+        with self._lock:
+            self._ids.pop(contract_id, None)
+            self._ids[contract_id] = True
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+
+
+def conditional_get_tween_factory(handler, registry):
+    known = KnownContracts()
+    path = conditional_path(getattr(registry, 'contract_route_prefix', None))
+
+    def conditional_get_tween(request):
+        match = request.method == 'GET' and 'download' not in request.GET and path.match(request.path)
+        if not match:
+            return handler(request)
+        contract_id = match.group('contract_id')
+        if request.if_none_match and contract_id in known:
+            rev = get_contract_rev(registry.db, contract_id)
+            if rev and contract_etag(rev, request) in request.if_none_match:
+                response = Response(status=304)
+                response.etag = contract_etag(rev, request)
+                return response
+        response = handler(request)
+        contract = request.__dict__.get('contract')
+        if response.status_code == 200 and IContract.providedBy(contract) and contract._rev:
+            known.add(contract.id)
+            response.etag = contract_etag(contract._rev, request)
+        return response
+
+    return conditional_get_tween
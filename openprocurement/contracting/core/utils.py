@@ -3,7 +3,12 @@ from openprocurement.api.utils import (
     apply_data_patch,
     generate_id,
 )
-from openprocurement.contracting.api.utils import save_contract
+from openprocurement.contracting.api.utils import (
+    contract_from_data as base_contract_from_data,
+    save_contract,
+)
+from openprocurement.contracting.core.migration import upgrade_contract
+from openprocurement.contracting.core.models import IContract
 
 
 class isContract(object):
@@ -37,13 +42,54 @@ def register_contract_contractType(config, model):
 
 
 def apply_patch(request, data=None, save=True, src=None):
-    data = request.validated['data'] if data is None else data
-    patch = data and apply_data_patch(src or request.context.serialize(), data)
+    """ Apply `data` patch to request context.
+
+    Only fields present in the patch are serialized and imported for
+    contracts, validated data is limited to fields touched by the request
+    (`request.validated['patch_fields']`) if known.
+    """
+    if data is None:
+        data = request.validated['data']
+        fields = request.validated.get('patch_fields')
+        if fields is not None and IContract.providedBy(request.context):
+            data = dict([(key, data[key]) for key in fields if key in data])
+    if not data:
+        return
+    if src is None:
+        fields = data.keys() if IContract.providedBy(request.context) else None
+        src = request.context.serialize(fields=fields) if fields else request.context.serialize()
+    patch = apply_data_patch(src, data)
     if patch:
         request.context.import_data(patch)
         if save:
             return save_contract(request)
 
 
+def iterview_pages(db, page_size, **options):
+    """ Iterate `contracts/all` rows grouped into pages of `page_size` rows """
+    page = []
+    for row in db.iterview('contracts/all', page_size, **options):
+        page.append(row)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
 def set_ownership(item, request):
     item.owner_token = generate_id()
+
+
+def contract_from_data(request, data, raise_error=True, create=True):
+    """ Request method building contract from `data` upgraded to the
+    latest schema (used in lazy migration mode), with compound fields
+    converted on first access when `contracts.lazy_load` is on.
+    """
+    if create:
+        data = upgrade_contract(request.registry, data)
+    lazy_fields = getattr(request.registry, 'contract_lazy_fields', ())
+    if not create or not lazy_fields:
+        return base_contract_from_data(request, data, raise_error, create)
+    model = base_contract_from_data(request, data, raise_error, create=False)
+    return model(data, lazy_fields=lazy_fields) if model is not None else None
@@ -1,12 +1,161 @@
 # -*- coding: utf-8 -*-
-from openprocurement.api.utils import update_logging_context, raise_operation_error
+from copy import copy
+
+from schematics.exceptions import ConversionError, ValidationError
+
+from openprocurement.api.utils import (
+    apply_data_patch,
+    error_handler,
+    update_logging_context,
+    raise_operation_error,
+)
+from openprocurement.api.models import Model
 from openprocurement.api.validation import validate_json_data, validate_data, OPERATIONS
-from openprocurement.contracting.core.models import Change
+from openprocurement.contracting.core.bulk import BULK_MAX_SIZE
+from openprocurement.contracting.core.models import (
+    Change, export_compiled, touched_fields, validation_dependencies
+)
+
+BATCH_MAX_SIZE = 100
+BATCH_OPERATIONS = ('change', 'document')
+
+
+def validate_bulk_contracts_data(request):
+    update_logging_context(request, {'contract_id': '__new__'})
+    try:
+        json = request.json_body
+    except ValueError as e:
+        request.errors.add('body', 'data', e.message)
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    data = json.get('data') if isinstance(json, dict) else None
+    if not isinstance(data, list) or not data:
+        request.errors.add('body', 'data', 'Data not available')
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    if len(data) > BULK_MAX_SIZE:
+        request.errors.add('body', 'data', 'Can\'t create more than {} contracts at once'.format(BULK_MAX_SIZE))
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    request.validated['json_data'] = data
+    return data
+
+
+def validate_contract_batch_data(request):
+    update_logging_context(request, {'change_id': '__new__', 'document_id': '__new__'})
+    try:
+        json = request.json_body
+    except ValueError as e:
+        request.errors.add('body', 'data', e.message)
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    data = json.get('data') if isinstance(json, dict) else None
+    if not isinstance(data, list) or not data or \
+            not all([isinstance(i, dict) and isinstance(i.get('data'), dict) for i in data]):
+        request.errors.add('body', 'data', 'Data not available')
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    if len(data) > BATCH_MAX_SIZE:
+        request.errors.add('body', 'data', 'Can\'t apply more than {} operations at once'.format(BATCH_MAX_SIZE))
+        request.errors.status = 422
+        raise error_handler(request.errors)
+    for index, operation in enumerate(data):
+        if operation.get('type') not in BATCH_OPERATIONS:
+            request.errors.add('body', 'data.{}.type'.format(index), 'Operation {} type should be one of {}'.format(
+                index, ', '.join(BATCH_OPERATIONS)))
+            request.errors.status = 422
+            raise error_handler(request.errors)
+    if not request.registry.docservice_url and any([i['type'] == 'document' for i in data]):
+        raise_operation_error(request, 'Can add document only from document service.')
+    request.validated['json_data'] = data
+    return data
 
 
 def validate_patch_contract_data(request):
     model = type(request.contract)
-    return validate_data(request, model, True)
+    if getattr(request, 'context', None) is not request.contract:
+        return validate_data(request, model, True)
+    data = validate_json_data(request)
+    fields = touched_fields(model, data)
+    # validated data has all fields of the role, only touched ones are applied
+    request.validated['patch_fields'] = keys = [model._fields[i].serialized_name or i for i in fields]
+    dependencies = validation_dependencies(model)
+    if dependencies is None or not fields or set(data) - set(keys):
+        # unknown fields are reported by full validation
+        return validate_data(request, model, True, data=data)
+    return validate_patch_fields(request, model, data, fields, dependencies)
+
+
+def validate_patch_fields(request, model, data, fields, dependencies):
+    """ Validate `data` patch of request contract checking only changed
+    `fields`, fields depending on them (`dependencies`), model level rules
+    of both and presence of required fields.
+
+    Output is the same as of `validate_data` for partial data, limited to
+    checked fields and plain values of the role.
+    """
+    contract = request.context
+    for name in list(fields):
+        fields.update(dependencies.get(name, ()))
+    names = dict([(model._fields[i].serialized_name or i, i) for i in fields])
+    src = contract.serialize(fields=names.keys())
+    patched = apply_data_patch(src, data) or src
+
+    m = copy(contract)
+    m._data = contract._data.copy()
+    m.__dict__.pop('_related_index', None)
+    errors = {}
+    for key, name in names.items():
+        if key not in patched:
+            continue
+        try:
+            value = model._fields[name].to_native(patched[key])
+        except (ConversionError, ValidationError) as e:
+            errors[key] = e.messages
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, Model) and getattr(item, '__parent__', None) is None:
+                item.__parent__ = m
+        m._data[name] = value
+    with m.related_index():
+        for key, name in names.items():
+            if key not in patched or key in errors:
+                continue
+            try:
+                model._fields[name].validate(m._data[name])
+            except ValidationError as e:
+                errors[key] = e.messages
+        for name, field in model._fields.items():
+            key = field.serialized_name or name
+            # raw values of lazy fields are not converted to be checked
+            if field.required and key not in errors and dict.get(m._data, name) is None:
+                errors[key] = [field.messages['required']]
+        for key, name in names.items():
+            if key not in errors and name in model._validator_functions and name in m._data:
+                try:
+                    model._validator_functions[name](model, m._data, m._data[name])
+                except (ConversionError, ValidationError) as e:
+                    errors[key] = e.messages
+    if errors:
+        for key, messages in errors.items():
+            request.errors.add('body', key, messages)
+        request.errors.status = 422
+        raise error_handler(request.errors)
+
+    role = contract.get_role()
+    if role not in model._options.roles:
+        request.errors.add('url', 'role', 'Forbidden')
+        request.errors.status = 403
+        raise error_handler(request.errors)
+    # compound fields neither touched nor depending on touched ones are left
+    # out, so the cost doesn't grow with items, documents and changes; plain
+    # values (e.g. status) are kept for validators reading them
+    keys = set(names).union([field.serialized_name or name for name, field in model._fields.items()
+                             if not hasattr(field, 'export_loop')])
+    field_converter = lambda field, value: field.to_primitive(value)
+    request.validated['data'] = data = export_compiled(model, m, field_converter, role=role, raise_error_on_role=True,
+                                                       print_none=True, fields=keys)
+    return data
 
 
 def validate_change_data(request):
@@ -75,5 +224,6 @@ def validate_contract_document_operation_not_in_allowed_contract_status(request)
 def validate_add_document_to_active_change(request):
     data = request.validated['data']
     if "relatedItem" in data and data.get('documentOf') == 'change':
-        if not [1 for c in request.validated['contract'].changes if c.id == data['relatedItem'] and c.status == 'pending']:
+        change = request.validated['contract'].get_related('change', data['relatedItem'])
+        if change is None or change.status != 'pending':
             raise_operation_error(request, 'Can\'t add document to \'active\' change')
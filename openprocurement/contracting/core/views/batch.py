@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from openprocurement.api.utils import APIResource, json_view
+from openprocurement.contracting.api.utils import contractingresource
+from openprocurement.contracting.core.batch import apply_batch
+from openprocurement.contracting.core.validation import validate_contract_batch_data
+
+
+@contractingresource(name='Contract Batch',
+                     path='/contracts/{contract_id}/batch',
+                     description="Batched changes and documents of a contract")
+class ContractBatchResource(APIResource):
+
+    @json_view(content_type="application/json", permission='edit_contract',
+               validators=(validate_contract_batch_data,))
+    def post(self):
+        """ Add changes and documents to contract
+
+        Operations are `{"type": "change" | "document", "data": {...}}`,
+        all of them are applied and saved at once or none is. Errors are
+        named by operation index, e.g. `data.1.relatedItem`.
+
+        Unlike the single document POST, a document with `"documentOf":
+        "change"` and no `relatedItem` is related to the change added
+        earlier in the same batch, as its id is not known beforehand.
+        Without such change `relatedItem` is required as usual.
+        """
+        added = apply_batch(self.request, self.request.validated['json_data'])
+        if added is not None:
+            self.request.response.status = 201
+            return {'data': [i.serialize('view') for i in added]}
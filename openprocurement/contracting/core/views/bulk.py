@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from openprocurement.api.utils import APIResource, json_view
+from openprocurement.contracting.api.utils import contractingresource
+from openprocurement.contracting.core.bulk import create_contracts
+from openprocurement.contracting.core.validation import validate_bulk_contracts_data
+
+
+@contractingresource(name='Contracts bulk',
+                     path='/contracts_bulk',
+                     description="Bulk creation of contracts")
+class ContractsBulkResource(APIResource):
+
+    @json_view(content_type="application/json", permission='create_contract',
+               validators=(validate_bulk_contracts_data,))
+    def post(self):
+        """ Create contracts
+
+        Returns result of each contract in order of request data: `status`
+        with `data` and `access` of created contract or `errors`.
+        """
+        return {'data': create_contracts(self.request, self.request.validated['json_data'])}
@@ -27,6 +27,9 @@ entry_points = {
     ],
     'openprocurement.api.migrations': [
         'contracts = openprocurement.contracting.core.migration:migrate_data'
+    ],
+    'console_scripts': [
+        'contracts_scan = openprocurement.contracting.core.scan:main'
     ]
 }
 